@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+import turbofloat
+import turbofloat.manager
+
+from tests.fakelib import FakeLib
+
+
+@pytest.fixture
+def lib(monkeypatch):
+    """A FakeLib that every TurboFloat and TurboFloatManager created in the test loads."""
+    fake = FakeLib()
+    monkeypatch.setattr(turbofloat, "load_library", lambda path: fake)
+    monkeypatch.setattr(turbofloat.manager, "load_library", lambda path: fake)
+    return fake
+
+
+@pytest.fixture
+def tf(lib):
+    return turbofloat.TurboFloat("guid", lambda status: None)
+
+
+@pytest.fixture
+def manager(lib):
+    return turbofloat.TurboFloatManager()
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+#
+# A fake TurboFloat library for the tests. It implements the TF_* functions
+# used by the python integration in pure python, so the tests can run without
+# libTurboFloat or a TurboFloat Server.
+
+import threading
+
+from turbofloat.c_wrapper import (
+    TF_OK,
+    TF_FAIL,
+    TF_E_INET,
+    TF_E_NO_FREE_LEASES,
+    TF_E_LEASE_EXISTS,
+    TF_E_NO_LEASE,
+    TF_E_SERVER,
+    TF_E_INSUFFICIENT_BUFFER
+)
+
+
+class FakeFunction(object):
+
+    """A stand-in for a ctypes function, including its restype."""
+
+    def __init__(self, impl):
+        self.impl = impl
+        self.restype = None
+
+    def __call__(self, *args):
+        ret = self.impl(*args)
+        return self.restype(ret) if self.restype is not None else ret
+
+
+class LeasePool(object):
+
+    """The seats of a fake TurboFloat Server, can be shared by several FakeLibs."""
+
+    def __init__(self, seats = 100):
+        self.seats = seats
+        self.lock = threading.Lock()
+
+
+class FakeLib(object):
+
+    def __init__(self, features = None, pool = None):
+        self.features = {b"export": b"1", b"batch": b"yes"} if features is None else features
+        self.pool = pool or LeasePool()
+        self.server = None
+        self.leases = set()
+        self.callbacks = {}
+        self.calls = []
+        self.next_handle = 1
+
+        # return codes (e.g. TF_E_INET) returned by the next TF_RequestLease calls
+        self.request_errors = []
+
+        # hooks for the thread safety tests, called with the function name
+        self.on_enter = None
+        self.on_exit = None
+
+        self._lock = threading.Lock()
+
+        for name in dir(self):
+            if name.startswith("_tf_"):
+                setattr(self, "TF_" + name[4:], FakeFunction(self._traced(name[4:], getattr(self, name))))
+
+    def _traced(self, name, impl):
+        def call(*args):
+            with self._lock:
+                self.calls.append((name,) + tuple(a for a in args[:1] if isinstance(a, int)))
+
+            if self.on_enter is not None:
+                self.on_enter(name)
+
+            try:
+                return impl(*args)
+            finally:
+                if self.on_exit is not None:
+                    self.on_exit(name)
+
+        return call
+
+    def called(self, name):
+        return [c for c in self.calls if c[0] == name]
+
+    def fire(self, handle, status):
+        """Calls the lease callback of the handle, like the library thread does."""
+        callback, user_ptr = self.callbacks[handle]
+
+        if user_ptr is None:
+            callback(status)
+        else:
+            callback(status, user_ptr)
+
+    def lose_lease(self, handle, status):
+        self._release(handle)
+        self.fire(handle, status)
+
+    def _release(self, handle):
+        if handle in self.leases:
+            self.leases.discard(handle)
+
+            with self.pool.lock:
+                self.pool.seats += 1
+
+    # TF_* functions
+
+    def _tf_PDetsFromPath(self, path):
+        return TF_OK
+
+    def _tf_GetHandle(self, guid):
+        with self._lock:
+            handle = self.next_handle
+            self.next_handle += 1
+
+        return handle
+
+    def _tf_SetLeaseCallback(self, handle, callback):
+        self.callbacks[handle] = (callback, None)
+        return TF_OK
+
+    def _tf_SetLeaseCallbackEx(self, handle, callback, user_ptr):
+        self.callbacks[handle] = (callback, user_ptr)
+        return TF_OK
+
+    def _tf_RequestLease(self, handle):
+        if self.request_errors:
+            return self.request_errors.pop(0)
+
+        if handle in self.leases:
+            return TF_E_LEASE_EXISTS
+
+        with self.pool.lock:
+            if not self.pool.seats:
+                return TF_E_NO_FREE_LEASES
+
+            self.pool.seats -= 1
+
+        self.leases.add(handle)
+        return TF_OK
+
+    def _tf_DropLease(self, handle):
+        if handle not in self.leases:
+            return TF_E_NO_LEASE
+
+        self._release(handle)
+        return TF_OK
+
+    def _tf_HasLease(self, handle):
+        return TF_OK if handle in self.leases else TF_FAIL
+
+    def _tf_Cleanup(self):
+        return TF_OK
+
+    def _tf_SaveServer(self, handle, host_address, port, flags):
+        self.server = (host_address, port.value)
+        return TF_OK
+
+    def _tf_GetServer(self, handle, buf, size, port):
+        if self.server is None:
+            return TF_E_SERVER
+
+        value = self.server[0]
+
+        if not buf:
+            return len(value) + 1
+
+        if size < len(value) + 1:
+            return TF_E_INSUFFICIENT_BUFFER
+
+        buf.value = value
+        port._obj.value = self.server[1]
+        return TF_OK
+
+    def _tf_GetFeatureValue(self, handle, name, buf, size):
+        value = self.features.get(name) if handle in self.leases else None
+
+        if value is None:
+            return TF_FAIL if buf else 0
+
+        if not buf:
+            return len(value) + 1
+
+        if size < len(value) + 1:
+            return TF_E_INSUFFICIENT_BUFFER
+
+        buf.value = value
+        return TF_OK
+
+    def _tf_IsDateValid(self, handle, date, flags):
+        return TF_OK
+
+    def _tf_SetCustomProxy(self, address):
+        return TF_OK
+
+    def _tf_GetVersion(self, major, minor, build, rev):
+        return TF_OK
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from turbofloat import (
+    CIRCUIT_CLOSED,
+    CIRCUIT_HALF_OPEN,
+    CIRCUIT_OPEN,
+    TF_E_INET,
+    TF_E_NO_FREE_LEASES,
+    CircuitBreaker,
+    TurboFloat,
+    TurboFloatInetError,
+    TurboFloatManager,
+    TurboFloatNoFreeLeasesError
+)
+
+
+def test_opens_after_network_failures_in_a_row(lib):
+    breaker = CircuitBreaker(failure_threshold = 2, cooldown = 60)
+    tf = TurboFloat("guid", None, circuit_breaker = breaker)
+    lib.request_errors = [TF_E_INET, TF_E_INET]
+
+    for _ in range(2):
+        with pytest.raises(TurboFloatInetError):
+            tf.request_lease()
+
+    assert breaker.state == CIRCUIT_OPEN
+    assert breaker.failures == 2
+
+    # fails fast without calling the library
+    requests = len(lib.called("RequestLease"))
+
+    with pytest.raises(TurboFloatInetError):
+        tf.request_lease()
+
+    assert len(lib.called("RequestLease")) == requests
+
+
+def test_server_errors_close_the_circuit(lib):
+    breaker = CircuitBreaker(failure_threshold = 2)
+    tf = TurboFloat("guid", None, circuit_breaker = breaker)
+    lib.request_errors = [TF_E_INET, TF_E_NO_FREE_LEASES]
+
+    with pytest.raises(TurboFloatInetError):
+        tf.request_lease()
+
+    with pytest.raises(TurboFloatNoFreeLeasesError):
+        tf.request_lease()
+
+    assert breaker.state == CIRCUIT_CLOSED
+    assert breaker.failures == 0
+
+
+def test_probe_after_the_cooldown(lib):
+    breaker = CircuitBreaker(failure_threshold = 1, cooldown = 0)
+    tf = TurboFloat("guid", None, circuit_breaker = breaker)
+    breaker.on_failure(TurboFloatInetError())
+
+    assert breaker.state == CIRCUIT_OPEN
+
+    # a failed probe opens the circuit again
+    breaker.before_call()
+    assert breaker.state == CIRCUIT_HALF_OPEN
+    breaker.on_failure(TurboFloatInetError())
+    assert breaker.state == CIRCUIT_OPEN
+
+    # a probe that reaches the server closes it
+    tf.request_lease()
+    assert breaker.state == CIRCUIT_CLOSED
+
+
+def test_manager_breakers_per_product(lib):
+    manager = TurboFloatManager(circuit_breaker_factory = lambda guid: CircuitBreaker(failure_threshold = 1))
+    lib.request_errors = [TF_E_INET]
+
+    with pytest.raises(TurboFloatInetError):
+        manager.get("prodA").request_lease()
+
+    # prodB may use another server, so prodA's outage doesn't fail it
+    manager.get("prodB").request_lease()
+
+    assert manager.get("prodA")._circuit_breaker.state == CIRCUIT_OPEN
+    assert manager.get("prodB")._circuit_breaker.state == CIRCUIT_CLOSED
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+import os
+import socket
+import threading
+
+import pytest
+
+import turbofloat
+
+from turbofloat import (
+    TF_E_INET,
+    HandoffServer,
+    TurboFloat,
+    TurboFloatError,
+    request_lease_with_handoff
+)
+
+from tests.fakelib import FakeLib, LeasePool
+
+
+@pytest.fixture
+def pool():
+    return LeasePool(seats = 1)
+
+
+@pytest.fixture
+def make_tf(monkeypatch):
+    def make_tf(fake):
+        monkeypatch.setattr(turbofloat, "load_library", lambda path: fake)
+        return TurboFloat("guid", None)
+
+    return make_tf
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "lease.sock")
+
+
+def start_server(tf, path):
+    released = threading.Event()
+    server = HandoffServer(tf, path, on_released = released.set, timeout = 5)
+    server.start()
+    return server, released
+
+
+def test_hands_off_the_only_seat(pool, make_tf, path):
+    old_lib = FakeLib(features = {b"export": b"1", b"legacy": b"1"}, pool = pool)
+    old = make_tf(old_lib)
+    old.request_lease()
+    old.guard("export", "legacy")
+    server, released = start_server(old, path)
+
+    new_lib = FakeLib(features = {b"export": b"1"}, pool = pool)
+    new = make_tf(new_lib)
+
+    assert request_lease_with_handoff(new, path, timeout = 5)
+    assert released.wait(5)
+    assert not old_lib.leases
+    assert new.has_lease()
+    assert not os.path.exists(path)
+
+    # the features of the old process are imported
+    assert new.guard("export", "legacy")
+
+
+def test_without_a_previous_process(lib, tf, path):
+    assert not request_lease_with_handoff(tf, path, timeout = 5)
+    assert tf.has_lease()
+
+
+def test_features_come_from_the_library_when_a_seat_is_free(make_tf, path):
+    pool = LeasePool(seats = 2)
+    old = make_tf(FakeLib(features = {b"legacy": b"1"}, pool = pool))
+    old.request_lease()
+    old.guard("legacy")
+    server, released = start_server(old, path)
+
+    new = make_tf(FakeLib(features = {}, pool = pool))
+
+    assert request_lease_with_handoff(new, path, timeout = 5)
+    assert released.wait(5)
+    assert not new.guard("legacy")
+
+
+def test_failed_release_keeps_the_old_lease(pool, make_tf, path):
+    old_lib = FakeLib(pool = pool)
+    old = make_tf(old_lib)
+    old.request_lease()
+    old_lib.TF_DropLease.impl = lambda handle: TF_E_INET
+    server, released = start_server(old, path)
+
+    new_lib = FakeLib(pool = pool)
+    new = make_tf(new_lib)
+
+    try:
+        with pytest.raises(TurboFloatError):
+            request_lease_with_handoff(new, path, timeout = 5)
+
+        assert not released.is_set()
+        assert old_lib.leases
+        assert not new_lib.leases
+        assert os.path.exists(path)
+    finally:
+        server.stop()
+
+
+def silent_server(path, hang_up):
+    # a previous process that never answers (or hangs up right away)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.listen(1)
+    connections = []
+
+    def serve():
+        conn, _ = sock.accept()
+
+        if hang_up:
+            conn.close()
+        else:
+            connections.append(conn)
+
+    thread = threading.Thread(target=serve)
+    thread.daemon = True
+    thread.start()
+
+    return sock, connections
+
+
+@pytest.mark.parametrize("hang_up", [False, True])
+def test_broken_handoff_keeps_an_acquired_lease(lib, tf, path, hang_up):
+    sock, connections = silent_server(path, hang_up)
+
+    try:
+        assert not request_lease_with_handoff(tf, path, timeout = 0.2)
+        assert tf.has_lease()
+    finally:
+        sock.close()
+
+        for conn in connections:
+            conn.close()
+
+
+@pytest.mark.parametrize("hang_up", [False, True])
+def test_broken_handoff_without_a_lease_raises(pool, make_tf, path, hang_up):
+    pool.seats = 0
+    new = make_tf(FakeLib(pool = pool))
+    sock, connections = silent_server(path, hang_up)
+
+    try:
+        with pytest.raises(TurboFloatError):
+            request_lease_with_handoff(new, path, timeout = 0.2)
+
+        assert not new.has_lease()
+    finally:
+        sock.close()
+
+        for conn in connections:
+            conn.close()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+from turbofloat import (
+    TF_CB_EXPIRED_INET,
+    TF_CB_LEASE_REGAINED,
+    TF_E_NO_FREE_LEASES,
+    TurboFloat,
+    TurboFloatError,
+    TurboFloatNoFreeLeasesError,
+    JournalRecord,
+    LeaseJournal,
+    read_journal,
+    summarize_journal
+)
+from turbofloat.journal import (
+    JOURNAL_CALLBACK,
+    JOURNAL_CLEANUP,
+    JOURNAL_DROP,
+    JOURNAL_GRANT,
+    JOURNAL_REQUEST,
+    JOURNAL_REQUEST_FAILED,
+    JOURNAL_UNKNOWN_CODE
+)
+
+import pytest
+
+
+def test_records_the_lease_lifecycle(lib, tmp_path):
+    path = str(tmp_path / "leases.journal")
+    journal = LeaseJournal(path)
+    tf = TurboFloat("guid", None, journal = journal)
+    lib.request_errors = [TF_E_NO_FREE_LEASES]
+
+    with pytest.raises(TurboFloatNoFreeLeasesError):
+        tf.request_lease()
+
+    tf.request_lease()
+    lib.fire(tf._handle, TF_CB_EXPIRED_INET)
+    tf.drop_lease()
+    tf.cleanup()
+    journal.close()
+
+    records = read_journal(path)
+
+    assert [(r.event, r.code) for r in records] == [
+        (JOURNAL_REQUEST, 0),
+        (JOURNAL_REQUEST_FAILED, TF_E_NO_FREE_LEASES),
+        (JOURNAL_REQUEST, 0),
+        (JOURNAL_GRANT, 0),
+        (JOURNAL_CALLBACK, TF_CB_EXPIRED_INET),
+        (JOURNAL_DROP, 0),
+        (JOURNAL_CLEANUP, 0)
+    ]
+    assert all(r.handle == tf._handle for r in records)
+
+
+def test_the_ring_keeps_the_newest_records(tmp_path):
+    path = str(tmp_path / "leases.journal")
+
+    with LeaseJournal(path, capacity = 4) as journal:
+        for handle in range(3):
+            journal.record(handle, JOURNAL_REQUEST)
+
+    # reopening keeps appending (and keeps the file's capacity)
+    with LeaseJournal(path, capacity = 100) as journal:
+        for handle in range(3, 6):
+            journal.record(handle, JOURNAL_REQUEST)
+
+    assert [r.handle for r in read_journal(path)] == [2, 3, 4, 5]
+
+
+def test_summary():
+    def record(time, event, code = 0):
+        return JournalRecord(time, 1, 7, event, code)
+
+    summary = summarize_journal([
+        record(10.0, JOURNAL_REQUEST),
+        record(12.0, JOURNAL_GRANT),
+        record(20.0, JOURNAL_CALLBACK, TF_CB_EXPIRED_INET),
+        record(25.0, JOURNAL_CALLBACK, TF_CB_LEASE_REGAINED),
+        record(30.0, JOURNAL_DROP)
+    ])
+
+    assert summary.acquire_times == [2.0]
+    assert summary.seat_hold_time == 13.0
+    assert summary.outages == [(1, 7, 20.0, 25.0)]
+
+
+def test_other_files_are_never_overwritten(tmp_path):
+    path = tmp_path / "notes.txt"
+    text = b"not a journal\n" * 16
+    path.write_bytes(text)
+
+    with pytest.raises(ValueError):
+        LeaseJournal(str(path))
+
+    assert path.read_bytes() == text
+
+
+def test_codes_that_dont_fit_are_unknown(lib, tmp_path):
+    path = str(tmp_path / "leases.journal")
+    journal = LeaseJournal(path)
+    tf = TurboFloat("guid", None, journal = journal)
+    lib.request_errors = [-5]
+
+    # the library's error is raised, not a struct.error
+    with pytest.raises(TurboFloatError):
+        tf.request_lease()
+
+    journal.record(tf._handle, JOURNAL_CALLBACK, 0x10000)
+    journal.close()
+
+    assert [(r.event, r.code) for r in read_journal(path)] == [
+        (JOURNAL_REQUEST, 0),
+        (JOURNAL_REQUEST_FAILED, JOURNAL_UNKNOWN_CODE),
+        (JOURNAL_CALLBACK, JOURNAL_UNKNOWN_CODE)
+    ]
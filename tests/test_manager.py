@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from turbofloat import (
+    TF_CB_LEASE_DROPPED,
+    TurboFloat,
+    TurboFloatLeaseExistsError
+)
+
+
+def test_handles_are_created_once_per_guid(lib, manager):
+    a = manager.get("a")
+
+    assert manager.get("a") is a
+    assert manager.get("b") is not a
+    assert len(lib.called("GetHandle")) == 2
+    assert len(manager.handles()) == 2
+
+
+def test_instances_are_slotted(manager):
+    tf = manager.get("a")
+
+    assert isinstance(tf, TurboFloat)
+    assert not hasattr(tf, "__dict__")
+
+
+def test_request_leases(lib, manager):
+    manager.get("b").request_lease()
+
+    results = manager.request_leases(["a", "b", "c", "a"], max_workers = 2)
+
+    assert results["a"] is None
+    assert results["c"] is None
+    assert isinstance(results["b"], TurboFloatLeaseExistsError)
+    assert len(lib.called("RequestLease")) == 4
+
+
+def test_request_leases_needs_a_worker(lib, manager):
+    with pytest.raises(ValueError):
+        manager.request_leases(["a"], max_workers = 0)
+
+    assert not lib.called("RequestLease")
+
+
+def test_request_leases_reports_unexpected_errors(lib, manager):
+    def broken(handle):
+        raise RuntimeError("broken")
+
+    lib.TF_RequestLease.impl = broken
+
+    results = manager.request_leases(["a"])
+
+    assert isinstance(results["a"], RuntimeError)
+
+
+def test_callbacks_are_routed_to_their_product(lib):
+    import turbofloat
+
+    received = []
+    manager = turbofloat.TurboFloatManager(callback = lambda guid, status: received.append((guid, status)))
+    own = []
+
+    a = manager.get("a")
+    b = manager.get("b", callback = own.append)
+
+    lib.fire(b._handle, TF_CB_LEASE_DROPPED)
+    lib.fire(a._handle, TF_CB_LEASE_DROPPED)
+
+    assert own == [TF_CB_LEASE_DROPPED]
+    assert received == [("a", TF_CB_LEASE_DROPPED)]
+    assert manager.last_status("a") == TF_CB_LEASE_DROPPED
+
+
+def test_late_callbacks_after_cleanup_are_ignored(lib, manager):
+    received = []
+    old = manager.get("a", callback = received.append)
+    handle = old._handle
+
+    manager.cleanup()
+    manager.get("b", callback = received.append)
+
+    lib.fire(handle, TF_CB_LEASE_DROPPED)
+
+    assert received == []
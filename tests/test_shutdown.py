@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+import signal
+import threading
+
+import pytest
+
+from turbofloat import (
+    TF_E_COM,
+    TF_E_INET,
+    ShutdownCoordinator,
+    TurboFloatComError,
+    TurboFloatInetError
+)
+
+
+def test_drops_every_lease_then_cleans_up(lib, manager):
+    manager.request_leases(["a", "b", "c"])
+    manager.get("d")
+
+    reports = []
+    coordinator = ShutdownCoordinator(timeout = 5, reporter = reports.append)
+    coordinator.register(manager)
+
+    report = coordinator.shutdown()
+
+    assert len(report.dropped) == 3
+    assert report.failed == {}
+    assert report.unfinished == []
+    assert report.cleaned_up
+    assert len(lib.called("Cleanup")) == 1
+    assert reports == [report]
+    assert coordinator.shutdown() is report
+
+
+def test_failed_drops_are_reported(lib, tf):
+    tf.request_lease()
+    lib.TF_DropLease.impl = lambda handle: TF_E_INET
+
+    coordinator = ShutdownCoordinator()
+    coordinator.register(tf)
+    report = coordinator.shutdown()
+
+    assert isinstance(report.failed[tf], TurboFloatInetError)
+    assert report.dropped == []
+
+
+def test_drops_past_the_deadline_are_unfinished(lib, manager):
+    manager.request_leases(["a", "b"])
+    slow = manager.get("b")._handle
+    release = threading.Event()
+    finished = threading.Event()
+    drop = lib.TF_DropLease.impl
+
+    def slow_drop(handle):
+        if handle != slow:
+            return drop(handle)
+
+        release.wait(5)
+
+        try:
+            return drop(handle)
+        finally:
+            finished.set()
+
+    lib.TF_DropLease.impl = slow_drop
+
+    coordinator = ShutdownCoordinator(timeout = 0.1)
+    coordinator.register(manager)
+    report = coordinator.shutdown()
+
+    # let the slow drop finish after the report was made
+    release.set()
+    assert finished.wait(5)
+
+    assert report.unfinished == [manager.get("b")]
+    assert report.dropped == [manager.get("a")]
+    assert not report.cleaned_up
+    assert not lib.called("Cleanup")
+
+
+def test_cleanup_errors_are_reported(lib, tf):
+    tf.request_lease()
+    lib.TF_Cleanup.impl = lambda: TF_E_COM
+
+    reports = []
+    coordinator = ShutdownCoordinator(reporter = reports.append)
+    coordinator.register(tf)
+    report = coordinator.shutdown()
+
+    assert reports == [report]
+    assert report.dropped == [tf]
+    assert not report.cleaned_up
+    assert isinstance(report.cleanup_errors[tf], TurboFloatComError)
+
+
+def test_unexpected_drop_errors_are_failures(lib, manager):
+    manager.request_leases(["a", "b"])
+    a, b = manager.get("a"), manager.get("b")
+    broken = b._handle
+    drop = lib.TF_DropLease.impl
+
+    def broken_drop(handle):
+        if handle == broken:
+            raise RuntimeError("drop")
+
+        return drop(handle)
+
+    lib.TF_DropLease.impl = broken_drop
+
+    coordinator = ShutdownCoordinator()
+    coordinator.register(manager)
+    report = coordinator.shutdown()
+
+    assert isinstance(report.failed[b], RuntimeError)
+    assert report.dropped == [a]
+    assert report.unfinished == []
+    assert report.cleaned_up
+
+
+def test_sigterm_is_passed_on_when_the_shutdown_fails(lib, tf):
+    def reporter(report):
+        raise RuntimeError("reporter")
+
+    signals = []
+    coordinator = ShutdownCoordinator(reporter = reporter)
+    coordinator.register(tf)
+    coordinator._previous_sigterm = lambda signum, frame: signals.append(signum)
+
+    with pytest.raises(RuntimeError):
+        coordinator._on_sigterm(signal.SIGTERM, None)
+
+    assert signals == [signal.SIGTERM]
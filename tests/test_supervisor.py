@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+from turbofloat import TF_CB_EXPIRED_INET, TF_E_INET
+
+
+def wait_for_recoveries(supervisor, count):
+    recovered = []
+    done = threading.Event()
+
+    def subscriber(attempts, recovery_time):
+        recovered.append(attempts)
+
+        if len(recovered) == count:
+            done.set()
+
+    supervisor.subscribe(subscriber)
+    return recovered, done
+
+
+def test_reacquires_a_lost_lease(lib, tf):
+    tf.request_lease()
+    supervisor = tf.start_supervisor(initial_delay = 0.01, max_delay = 0.02)
+    recovered, done = wait_for_recoveries(supervisor, 1)
+
+    lib.request_errors = [TF_E_INET]
+    lib.lose_lease(tf._handle, TF_CB_EXPIRED_INET)
+
+    assert done.wait(5)
+    assert recovered == [2]
+    assert tf.has_lease()
+    assert not supervisor.recovering
+
+    tf.stop_supervisor()
+
+
+def test_stop_ends_the_recovery(lib, tf):
+    tf.request_lease()
+    supervisor = tf.start_supervisor(initial_delay = 60)
+    lib.lose_lease(tf._handle, TF_CB_EXPIRED_INET)
+
+    assert supervisor.recovering
+
+    tf.stop_supervisor()
+    supervisor._thread.join(5)
+
+    assert not supervisor._thread.is_alive()
+    assert not supervisor.recovering
+    assert len(lib.called("RequestLease")) == 1
+
+
+def test_manager_cleanup_stops_the_supervisors(lib, manager):
+    tf = manager.get("a")
+    tf.request_lease()
+    supervisor = tf.start_supervisor(initial_delay = 60)
+    lib.lose_lease(tf._handle, TF_CB_EXPIRED_INET)
+
+    manager.cleanup()
+    supervisor._thread.join(5)
+
+    assert not supervisor._thread.is_alive()
+    assert not supervisor.recovering
+    assert tf._supervisor is None
+
+
+def test_errors_dont_stop_the_supervisor(lib, tf):
+    tf.request_lease()
+    supervisor = tf.start_supervisor(initial_delay = 0.01, max_delay = 0.02)
+
+    def broken_subscriber(attempts, recovery_time):
+        raise RuntimeError("subscriber")
+
+    supervisor.subscribe(broken_subscriber)
+    recovered = []
+    regained = threading.Semaphore(0)
+
+    def subscriber(attempts, recovery_time):
+        recovered.append(attempts)
+        regained.release()
+
+    supervisor.subscribe(subscriber)
+
+    request = lib.TF_RequestLease.impl
+    failures = [RuntimeError("library")]
+
+    def unexpected_error(handle):
+        if failures:
+            raise failures.pop()
+
+        return request(handle)
+
+    lib.TF_RequestLease.impl = unexpected_error
+
+    # the first recovery survives an unexpected error, the second one
+    # shows the thread survived the broken subscriber
+    lib.lose_lease(tf._handle, TF_CB_EXPIRED_INET)
+    assert regained.acquire(timeout = 5)
+
+    lib.lose_lease(tf._handle, TF_CB_EXPIRED_INET)
+    assert regained.acquire(timeout = 5)
+
+    assert recovered == [2, 1]
+    assert tf.has_lease()
+    assert isinstance(supervisor.last_error, RuntimeError)
+
+    tf.stop_supervisor()
+
+
+def test_lease_lost_during_a_recovery_is_recovered_again(lib, tf):
+    tf.request_lease()
+    supervisor = tf.start_supervisor(initial_delay = 0.01, max_delay = 0.02)
+    regained = threading.Semaphore(0)
+    supervisor.subscribe(lambda attempts, recovery_time: regained.release())
+    lost = []
+
+    def lose_again(name):
+        # the lease is lost again right after the supervisor re-acquired it
+        if name == "RequestLease" and not lost:
+            lost.append(name)
+            lib.lose_lease(tf._handle, TF_CB_EXPIRED_INET)
+
+    lib.lose_lease(tf._handle, TF_CB_EXPIRED_INET)
+    lib.on_exit = lose_again
+
+    assert regained.acquire(timeout = 5)
+    assert regained.acquire(timeout = 5)
+    assert lost
+    assert tf.has_lease()
+
+    tf.stop_supervisor()
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+from turbofloat import TF_CB_FEATURES_CHANGED, wstr_empty
+
+READS = ("GetFeatureValue", "HasLease", "GetServer")
+WRITES = ("RequestLease", "DropLease", "SaveServer", "Cleanup")
+
+
+class Tracker(object):
+
+    """Counts the TF_* calls that are running at the same time."""
+
+    def __init__(self, lib, delay = 0.005):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.readers = 0
+        self.writers = 0
+        self.peak_readers = 0
+        self.violations = []
+
+        lib.on_enter = self.enter
+        lib.on_exit = self.exit
+
+    def enter(self, name):
+        with self.lock:
+            if name in READS:
+                self.readers += 1
+                self.peak_readers = max(self.peak_readers, self.readers)
+
+                if self.writers:
+                    self.violations.append(name)
+            elif name in WRITES:
+                self.writers += 1
+
+                if self.writers > 1 or self.readers:
+                    self.violations.append(name)
+
+        time.sleep(self.delay)
+
+    def exit(self, name):
+        with self.lock:
+            if name in READS:
+                self.readers -= 1
+            elif name in WRITES:
+                self.writers -= 1
+
+
+def run_threads(targets):
+    errors = []
+
+    def run(target):
+        try:
+            target()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(target,)) for target in targets]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join(10)
+        assert not thread.is_alive()
+
+    assert errors == []
+
+
+def test_readers_run_concurrently(lib, tf):
+    tf.request_lease()
+    tracker = Tracker(lib)
+
+    def reader():
+        for _ in range(5):
+            assert tf.get_feature_value("export") == b"1"
+
+    run_threads([reader] * 8)
+
+    assert tracker.peak_readers > 1
+    assert not tracker.violations
+
+
+def test_writers_are_exclusive(lib, tf):
+    tf.request_lease()
+    tracker = Tracker(lib, delay = 0.002)
+
+    def reader():
+        for _ in range(10):
+            tf.has_feature("export")
+            tf.has_lease()
+
+    def lease_writer():
+        for _ in range(5):
+            tf.drop_lease()
+            tf.request_lease()
+
+    def settings_writer():
+        for _ in range(5):
+            tf.save_server("127.0.0.1", 13, 0)
+
+    run_threads([reader] * 6 + [lease_writer, settings_writer])
+
+    assert not tracker.violations
+
+
+def test_callback_during_write_does_not_deadlock(lib, tf):
+    guard = tf.guard("export")
+    statuses = []
+
+    def fire_and_wait(name):
+        # the library calls back on its own thread while the request is running
+        if name == "RequestLease":
+            lib.on_enter = None
+
+            thread = threading.Thread(target=lib.fire, args=(tf._handle, TF_CB_FEATURES_CHANGED))
+            thread.start()
+            thread.join(5)
+
+            assert not thread.is_alive()
+
+    tf._user_callback = statuses.append
+    lib.on_enter = fire_and_wait
+
+    tf.request_lease()
+
+    assert statuses == [TF_CB_FEATURES_CHANGED]
+    assert guard
+
+
+def test_callback_can_read_while_a_drop_waits_for_it(lib, tf):
+    tf.request_lease()
+    values = []
+    drop = lib.TF_DropLease.impl
+
+    def callback(status):
+        # what the example app does when the features change
+        values.append(tf.get_feature_value("export"))
+
+    def drop_and_wait(handle):
+        # the library waits for its callback thread while dropping the lease
+        thread = threading.Thread(target=lib.fire, args=(handle, TF_CB_FEATURES_CHANGED))
+        thread.start()
+        thread.join(2)
+
+        assert not thread.is_alive()
+        return drop(handle)
+
+    tf._user_callback = callback
+    lib.TF_DropLease.impl = drop_and_wait
+
+    run_threads([tf.drop_lease])
+
+    assert values == [b"1" if isinstance(wstr_empty, bytes) else u"1"]
+    assert not tf.has_lease()
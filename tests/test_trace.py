@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from turbofloat import (
+    TF_CB_EXPIRED_INET,
+    TF_E_INET,
+    TF_OK,
+    TurboFloat,
+    TurboFloatInetError,
+    TraceRecorder,
+    TraceReplayer,
+    read_trace
+)
+from turbofloat.trace import TRACE_CALL, TRACE_CALLBACK
+
+
+def record_session(lib, path):
+    with TraceRecorder(path) as recorder:
+        tf = TurboFloat("guid", lambda status: None, recorder = recorder)
+        lib.request_errors = [TF_E_INET]
+
+        with pytest.raises(TurboFloatInetError):
+            tf.request_lease()
+
+        tf.request_lease()
+        lib.fire(tf._handle, TF_CB_EXPIRED_INET)
+
+    return tf
+
+
+def test_records_calls_and_callbacks(lib, tmp_path):
+    path = str(tmp_path / "lease.trace")
+    tf = record_session(lib, path)
+
+    records = read_trace(path)
+    calls = [(r.function_name, r.code) for r in records if r.kind == TRACE_CALL]
+    callbacks = [(r.handle, r.code) for r in records if r.kind == TRACE_CALLBACK]
+
+    assert calls == [
+        ("TF_PDetsFromPath", TF_OK),
+        ("TF_GetHandle", tf._handle),
+        ("TF_SetLeaseCallback", TF_OK),
+        ("TF_RequestLease", TF_E_INET),
+        ("TF_RequestLease", TF_OK)
+    ]
+    assert callbacks == [(tf._handle, TF_CB_EXPIRED_INET)]
+    assert [r.time for r in records] == sorted(r.time for r in records)
+
+
+def test_replays_the_recorded_session(lib, tmp_path):
+    path = str(tmp_path / "lease.trace")
+    record_session(lib, path)
+
+    statuses = []
+    replayer = TraceReplayer(path, speed = 0)
+    tf = replayer.turbofloat("guid", statuses.append)
+
+    replayer.start()
+
+    with pytest.raises(TurboFloatInetError):
+        tf.request_lease()
+
+    tf.request_lease()
+    replayer.join(5)
+
+    assert statuses == [TF_CB_EXPIRED_INET]
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from turbofloat import (
+    TF_CB_EXPIRED,
+    TF_CB_FEATURES_CHANGED,
+    TF_USER,
+    TurboFloatFeatureError,
+    encode_str,
+    encode_str_cache_size,
+    is_win,
+    wstr_empty
+)
+from turbofloat.c_wrapper import _dict_cache
+
+
+def test_get_server_grows_the_shared_buffer(lib, tf):
+    host = b"tfs-" + b"x" * 400 + b".example.com"
+    tf.save_server(host if isinstance(wstr_empty, bytes) else host.decode(), 13, TF_USER)
+
+    assert tf.get_server() == (lib.server[0], 13)
+
+
+def test_get_server_never_returns_stale_buffers(lib, tf):
+    tf.request_lease()
+
+    # fill the shared buffer with a feature value
+    assert tf.get_feature_value("export")
+
+    # like before the buffers were shared, no saved server is an empty location
+    assert tf.get_server() == (wstr_empty, 0)
+
+
+def test_encode_str():
+    name = u"caf\xe9"
+    encoded = name if is_win else name.encode("utf-8")
+
+    assert encode_str(name) == encoded
+    assert encode_str(name.encode("utf-8")) == encoded
+    assert encode_str(name) is encode_str(name)
+
+
+def test_names_can_be_pre_encoded(lib, tf):
+    tf.request_lease()
+
+    assert tf.get_feature_value(b"export") == tf.get_feature_value("export")
+    assert tf.has_feature(b"batch")
+    assert not tf.has_feature(b"missing")
+
+
+def test_encode_str_cache_is_bounded():
+    for i in range(encode_str_cache_size * 2):
+        encode_str("feature-%d" % i)
+
+    info = encode_str.cache_info()
+
+    assert info.maxsize == encode_str_cache_size
+    assert info.currsize <= encode_str_cache_size
+
+
+def test_python_2_encode_str_cache():
+    calls = []
+
+    def encode(string):
+        calls.append(string)
+        return string.encode("utf-8")
+
+    cached = _dict_cache(2)(encode)
+
+    assert cached("a") == b"a"
+    assert cached("a") == b"a"
+    assert calls == ["a"]
+
+    # the cache starts over once it's full
+    cached("b")
+    cached("c")
+    cached("a")
+
+    assert calls == ["a", "b", "c", "a"]
+
+
+def test_guard_follows_the_lease(lib, tf):
+    export = tf.guard("export")
+    both = tf.guard("export", "batch")
+    missing = tf.guard("export", "missing")
+
+    assert not export
+
+    tf.request_lease()
+    assert export and both
+    assert not missing
+    assert missing.missing() == ["missing"]
+
+    lib.features[b"batch"] = None
+    lib.fire(tf._handle, TF_CB_FEATURES_CHANGED)
+    assert export and not both
+
+    with pytest.raises(TurboFloatFeatureError):
+        with both:
+            pass
+
+    tf.drop_lease()
+    assert not export
+
+
+def test_lease_lost_during_a_refresh_clears_the_features(lib, tf):
+    export = tf.guard("export")
+    lost = []
+
+    def lose_lease(name):
+        # the library reports the lease lost after the refresh in
+        # request_lease() read the features but before it stored them
+        if name == "GetFeatureValue" and not lost:
+            lost.append(name)
+            lib.fire(tf._handle, TF_CB_EXPIRED)
+
+    lib.on_exit = lose_lease
+    tf.request_lease()
+
+    assert lost
+    assert not export
+
+
+def test_guard_names_can_be_pre_encoded(lib, tf):
+    tf.request_lease()
+    text = tf.guard("export")
+    encoded = tf.guard(b"export")
+
+    assert text.mask == encoded.mask
+    assert tf._export_features() == ["export"]
+
+    tf._import_features(["export", "imported"])
+    assert tf.guard(b"imported")
+    assert sorted(tf._export_features()) == ["export", "imported"]
@@ -24,29 +24,114 @@
 # FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
 # IN THE SOFTWARE.
 
-from ctypes import pointer, c_uint32, c_ushort
+from ctypes import byref, pointer, c_uint32, c_ushort
 
 from turbofloat.c_wrapper import *
+from turbofloat.guard import FeatureGuard
+from turbofloat.supervisor import LeaseSupervisor
+from turbofloat.journal import (
+    JOURNAL_REQUEST,
+    JOURNAL_GRANT,
+    JOURNAL_REQUEST_FAILED,
+    JOURNAL_CALLBACK,
+    JOURNAL_DROP,
+    JOURNAL_CLEANUP
+)
+from turbofloat._sync import ReadWriteLock, unlocked
 
 import os
 import sys
+import threading
 
 #
 # Object oriented interface
 #
 
 
+def _exec_file_loc():
+    # load the executing file's location
+    if getattr(sys, 'frozen', False):
+        # running in a bundle
+        return os.path.dirname(os.path.abspath(sys.executable))
+
+    # running live
+    return os.path.dirname(os.path.abspath(sys.modules['__main__'].__file__))
+
+
+def _set_restype(lib):
+    lib.TF_PDetsFromPath.restype = validate_result
+    lib.TF_SetLeaseCallback.restype = validate_result
+    lib.TF_SetLeaseCallbackEx.restype = validate_result
+    lib.TF_SaveServer.restype = validate_result
+    lib.TF_RequestLease.restype = validate_result
+    lib.TF_DropLease.restype = validate_result
+    lib.TF_IsDateValid.restype = validate_result
+    lib.TF_SetCustomProxy.restype = validate_result
+    lib.TF_Cleanup.restype = validate_result
+
+
+def _load_dat_file(lib, dat_file_loc):
+    try:
+        lib.TF_PDetsFromPath(encode_str(dat_file_loc))
+    except TurboFloatFailError:
+        # The dat file is already loaded
+        pass
+
+
+# per-thread output buffers reused by get_server() and get_feature_value(),
+# shared by every handle because the values are copied out right away
+_buffers = threading.local()
+
+
 class TurboFloat(object):
 
-    def __init__(self, guid, callback, dat_file_loc = "", library_folder = ""):
+    """
+    Thread safety: a TurboFloat instance can be shared by any number of threads.
+    get_feature_value(), has_feature(), has_lease(), get_server(), is_date_valid(),
+    and feature guard checks run concurrently with each other, while request_lease(),
+    drop_lease(), save_server(), set_custom_proxy(), and cleanup() are serialized
+    and wait for the running reads to finish. This doesn't depend on the GIL, so it
+    also holds on free-threaded builds of Python.
+
+    The lease callback is called on a TurboFloat library thread without holding any
+    of these locks, and the calls it makes (e.g. get_feature_value() when the
+    features changed) skip them too. A drop_lease() or cleanup() running on another
+    thread can be waiting for the library thread to finish the callback, so taking
+    the locks there would deadlock. Note that cleanup() frees the handles of every
+    TurboFloat instance, so only call it once every other thread is done with them.
+    """
+
+    # TurboFloatManager creates one instance per product, so keep them compact
+    __slots__ = (
+        "_lib",
+        "_handle",
+        "_user_callback",
+        "_callback",
+        "_journal",
+        "_circuit_breaker",
+        "_supervisor",
+        "_feature_bits",
+        "_features",
+        "_features_gen",
+        "_features_lock",
+        "_rwlock",
+        "__weakref__"
+    )
+
+    def __init__(self, guid, callback, dat_file_loc = "", library_folder = "", recorder = None, journal = None,
+                 circuit_breaker = None):
+        """
+        The optional recorder (a TraceRecorder) records every TF_* call and
+        lease callback made through this instance.
+
+        The optional journal (a LeaseJournal) records every lease lifecycle
+        event of this instance.
 
-        # load the executing file's location
-        if getattr(sys, 'frozen', False):
-            # running in a bundle
-            execFileLoc = os.path.dirname(os.path.abspath(sys.executable))
-        else:
-            # running live
-            execFileLoc = os.path.dirname(os.path.abspath(sys.modules['__main__'].__file__))
+        The optional circuit_breaker (a CircuitBreaker) makes request_lease()
+        fail fast while the TurboFloat Server is unreachable.
+        """
+
+        execFileLoc = _exec_file_loc()
 
         if not library_folder:
             library_folder = execFileLoc
@@ -56,15 +141,32 @@ class TurboFloat(object):
             dat_file_loc = os.path.join(execFileLoc, "TurboActivate.dat")
 
         self._lib = load_library(library_folder)
-        self._set_restype()
 
-        try:
-            self._lib.TF_PDetsFromPath(wstr(dat_file_loc))
-        except TurboFloatFailError:
-            # The dat file is already loaded
-            pass
+        if recorder is not None:
+            self._lib = recorder.wrap(self._lib)
 
-        self._handle = self._lib.TF_GetHandle(wstr(guid))
+        _set_restype(self._lib)
+        _load_dat_file(self._lib, dat_file_loc)
+
+        self._init_handle(guid, callback)
+        self._journal = journal
+        self._circuit_breaker = circuit_breaker
+        self._set_lease_callback()
+
+    @classmethod
+    def _from_library(cls, lib, guid, callback):
+        """
+        Creates a TurboFloat instance on an already loaded (and prepared) library
+        without registering a lease callback. Used by TurboFloatManager, which
+        registers one shared callback for all of its handles.
+        """
+        self = cls.__new__(cls)
+        self._lib = lib
+        self._init_handle(guid, callback)
+        return self
+
+    def _init_handle(self, guid, callback):
+        self._handle = self._lib.TF_GetHandle(encode_str(guid))
 
         # if the handle is still unset then immediately throw an exception
         # telling the user that they need to actually load the correct
@@ -72,13 +174,50 @@ class TurboFloat(object):
         if self._handle == 0:
             raise TurboFloatDatFileError()
 
-        # "cast" the native python function to LeaseCallback type
+        self._user_callback = callback
+        self._journal = None
+        self._circuit_breaker = None
+        self._supervisor = None
+
+        # the features compiled by guard(), each (encoded) name has a bit in
+        # the self._features bitset that is set when the feature is available
+        self._feature_bits = {}
+        self._features = 0
+        self._features_lock = threading.Lock()
+
+        # bumped by every clear and refresh of self._features, so a refresh
+        # that finishes late can't overwrite a newer clear (e.g. a lost lease)
+        self._features_gen = 0
+
+        # reads run concurrently, calls that change the lease or
+        # settings are serialized (see the class docstring)
+        self._rwlock = ReadWriteLock()
+
+    def _set_lease_callback(self):
+        # "cast" the python function to LeaseCallback type
         # save it locally so that it acutally works when it's called
         # back
-        self._callback = LeaseCallback(callback)
+        self._callback = LeaseCallback(self._lease_callback)
 
         self._lib.TF_SetLeaseCallback(self._handle, self._callback)
 
+    def _lease_callback(self, status):
+        # see the class docstring, the calls made from here mustn't wait for self._rwlock
+        with unlocked():
+            if self._journal is not None:
+                self._journal.record(self._handle, JOURNAL_CALLBACK, status)
+
+            if self._supervisor is not None:
+                self._supervisor._on_lease_status(status)
+
+            if status == TF_CB_FEATURES_CHANGED or status == TF_CB_LEASE_REGAINED:
+                self._refresh_features()
+            else:
+                self._clear_features()
+
+            if self._user_callback is not None:
+                self._user_callback(status)
+
     #
     # Public
     #
@@ -113,20 +252,30 @@ class TurboFloat(object):
         This will set everything up so that subsequent calls with the TF_SYSTEM flag will
         succeed even if from non-admin processes.
         """
-        self._lib.TF_SaveServer(self._handle, wstr(host_address), c_ushort(port), flags)
+        with self._rwlock.write:
+            self._lib.TF_SaveServer(self._handle, encode_str(host_address), c_ushort(port), flags)
 
     def get_server(self):
         """
         Gets the stored TurboFloat Server location.
         """
 
-        buf_size = self._lib.TF_GetServer(self._handle, 0, 0, 0)
-        buf = wbuf(buf_size)
-        port = c_ushort(0)
+        with self._rwlock.read:
+            buf = self._buffer(0)
+            port = _buffers.port
+
+            ret = self._lib.TF_GetServer(self._handle, buf, len(buf), byref(port))
 
-        self._lib.TF_GetServer(self._handle, buf, buf_size, pointer(port))
+            if ret == TF_E_INSUFFICIENT_BUFFER:
+                buf = self._buffer(self._lib.TF_GetServer(self._handle, 0, 0, 0))
+                ret = self._lib.TF_GetServer(self._handle, buf, len(buf), byref(port))
 
-        return buf.value, port.value
+            # the buffers are shared, so never hand back what a failed call
+            # left in them, just the empty location there's no server saved
+            if ret != TF_OK:
+                return wstr_empty, 0
+
+            return buf.value, port.value
 
 
     # Leases
@@ -135,9 +284,16 @@ class TurboFloat(object):
         """
         Requests a floating license lease from the TurboFloat Server. You should run
         this at the top of your app after calling TF_SetLeaseCallback().
+
+        If there's a circuit breaker and its circuit is open, this immediately
+        raises the last network error instead of contacting the server.
         """
 
-        self._lib.TF_RequestLease(self._handle)
+        if self._circuit_breaker is not None:
+            self._circuit_breaker.before_call()
+
+        with self._rwlock.write:
+            self._request_lease()
 
 
     def drop_lease(self):
@@ -157,7 +313,15 @@ class TurboFloat(object):
                 }
         """
 
-        self._lib.TF_DropLease(self._handle)
+        with self._rwlock.write:
+            if self._supervisor is not None:
+                self._supervisor._cancel()
+
+            self._lib.TF_DropLease(self._handle)
+            self._clear_features()
+
+            if self._journal is not None:
+                self._journal.record(self._handle, JOURNAL_DROP)
 
 
     def has_lease(self):
@@ -167,29 +331,85 @@ class TurboFloat(object):
         and the callback function that you set in TF_SetLeaseCallback().
         """
 
-        ret = self._lib.TF_HasLease(self._handle)
+        with self._rwlock.read:
+            return self._has_lease()
 
-        if ret == TF_OK:
-            return True
-        elif ret == TF_FAIL:
-            return False
+    def start_supervisor(self, initial_delay = 1.0, max_delay = 60.0,
+                         statuses = (TF_CB_EXPIRED_INET, TF_CB_LEASE_DROPPED)):
+        """
+        Starts a LeaseSupervisor that re-acquires the lease in the background
+        (with capped exponential backoff) when the lease callback reports one of
+        the statuses. Use the returned supervisor to subscribe to regained leases
+        and to see the attempts and recovery time.
+        """
+        self.stop_supervisor()
 
-        # raise an error on all other return codes
-        validate_result(ret)
+        supervisor = LeaseSupervisor(self, initial_delay, max_delay, statuses)
+        supervisor.start()
+
+        self._supervisor = supervisor
+        return supervisor
+
+    def stop_supervisor(self):
+        supervisor, self._supervisor = self._supervisor, None
+
+        if supervisor is not None:
+            supervisor.stop(0)
 
     # License fields
 
     def has_feature(self, name):
-        return len(self.get_feature_value(name)) > 0
+        with self._rwlock.read:
+            return len(self._get_feature_value(name)) > 0
 
     def get_feature_value(self, name):
-        """Gets the value of a feature."""
-        buf_size = self._lib.TF_GetFeatureValue(self._handle, wstr(name), 0, 0)
-        buf = wbuf(buf_size)
+        """
+        Gets the value of a feature. The name can be a string or the
+        pre-encoded UTF-8 bytes of the name.
+        """
+        with self._rwlock.read:
+            return self._get_feature_value(name)
 
-        self._lib.TF_GetFeatureValue(self._handle, wstr(name), buf, buf_size)
+    def guard(self, *names):
+        """
+        Creates a FeatureGuard for the features. Use it as a decorator or a
+        context manager to raise TurboFloatFeatureError when any of the
+        features isn't available:
 
-        return buf.value
+            @tf.guard("export", "batch")
+            def export():
+                ...
+
+        Create guards once (e.g. at module level) and reuse them, each check is
+        then a single integer AND instead of calls into the TurboFloat library.
+        """
+        mask = 0
+        added = []
+
+        with self._rwlock.read:
+            with self._features_lock:
+                for name in names:
+                    # "export" and b"export" are the same feature
+                    name = encode_str(name)
+                    bit = self._feature_bits.get(name)
+
+                    if bit is None:
+                        bit = self._feature_bits[name] = 1 << len(self._feature_bits)
+                        added.append((name, bit))
+
+                    mask |= bit
+
+                gen = self._features_gen
+
+            if added:
+                features = self._available_features(added)
+
+                with self._features_lock:
+                    # a newer refresh already includes the added features
+                    if gen == self._features_gen:
+                        self._features |= features
+
+        return FeatureGuard(self, mask, names)
 
     # Utils
 
@@ -199,7 +419,8 @@ class TurboFloat(object):
         """
 
         try:
-            self._lib.TF_IsDateValid(self._handle, wstr(date), TF_HAS_NOT_EXPIRED)
+            with self._rwlock.read:
+                self._lib.TF_IsDateValid(self._handle, encode_str(date), TF_HAS_NOT_EXPIRED)
 
             return True
         except TurboFloatFlagsError as e:
@@ -220,7 +441,8 @@ class TurboFloat(object):
 
         If the port is not specified, TurboFloat will default to using port 1080 for proxies.
         """
-        self._lib.TF_SetCustomProxy(wstr(address))
+        with self._rwlock.write:
+            self._lib.TF_SetCustomProxy(encode_str(address))
 
     def cleanup(self):
         """
@@ -228,7 +450,14 @@ class TurboFloat(object):
         allocated memory for all open handles. If you have an active license
         lease then you should call tf.DropLease() before you call TurboFloat.Cleanup().
         """
-        self._lib.TF_Cleanup()
+        self.stop_supervisor()
+
+        with self._rwlock.write:
+            self._lib.TF_Cleanup()
+            self._clear_features()
+
+            if self._journal is not None:
+                self._journal.record(self._handle, JOURNAL_CLEANUP)
 
     def get_version(self):
         """
@@ -247,12 +476,151 @@ class TurboFloat(object):
 
         return major.value, minor.value, build.value, rev.value
 
-    def _set_restype(self):
-        self._lib.TF_PDetsFromPath.restype = validate_result
-        self._lib.TF_SetLeaseCallback.restype = validate_result
-        self._lib.TF_SaveServer.restype = validate_result
-        self._lib.TF_RequestLease.restype = validate_result
-        self._lib.TF_DropLease.restype = validate_result
-        self._lib.TF_IsDateValid.restype = validate_result
-        self._lib.TF_SetCustomProxy.restype = validate_result
-        self._lib.TF_Cleanup.restype = validate_result
+    def _request_lease(self):
+        # the caller holds the write lock
+        journal = self._journal
+        breaker = self._circuit_breaker
+
+        if journal is not None:
+            journal.record(self._handle, JOURNAL_REQUEST)
+
+        try:
+            self._lib.TF_RequestLease(self._handle)
+        except TurboFloatError as e:
+            if journal is not None:
+                journal.record_error(self._handle, JOURNAL_REQUEST_FAILED, e)
+
+            if breaker is not None:
+                breaker.on_failure(e)
+            raise
+
+        if journal is not None:
+            journal.record(self._handle, JOURNAL_GRANT)
+
+        if breaker is not None:
+            breaker.on_success()
+
+        self._refresh_features()
+
+    def _recover_lease(self, supervisor):
+        # called by the LeaseSupervisor, the recovery is checked under the write
+        # lock so a drop_lease() that cancels it (or a stop_supervisor() / cleanup()
+        # that stops the supervisor) can't be undone by this request
+        if self._circuit_breaker is not None:
+            self._circuit_breaker.before_call()
+
+        with self._rwlock.write:
+            if not supervisor._start_attempt():
+                return False
+
+            try:
+                self._request_lease()
+            except TurboFloatLeaseExistsError:
+                raise
+            except Exception:
+                supervisor._attempt_failed()
+                raise
+
+        return True
+
+    def _has_lease(self):
+        ret = self._lib.TF_HasLease(self._handle)
+
+        if ret == TF_OK:
+            return True
+        elif ret == TF_FAIL:
+            return False
+
+        # raise an error on all other return codes
+        validate_result(ret)
+
+    def _get_feature_value(self, name):
+        name = encode_str(name)
+        buf = self._buffer(0)
+
+        # try the reused buffer first and only ask for the size when it's too small
+        ret = self._lib.TF_GetFeatureValue(self._handle, name, buf, len(buf))
+
+        if ret == TF_E_INSUFFICIENT_BUFFER:
+            buf = self._buffer(self._lib.TF_GetFeatureValue(self._handle, name, 0, 0))
+            ret = self._lib.TF_GetFeatureValue(self._handle, name, buf, len(buf))
+
+        if ret != TF_OK:
+            return wstr_empty
+
+        return buf.value
+
+    def _export_features(self):
+        # the names of the guarded features that are available, for a lease handoff
+        features = self._features
+
+        return [name.decode("utf-8") if isinstance(name, bytes) else name
+                for name, bit in list(self._feature_bits.items()) if features & bit]
+
+    def _import_features(self, names):
+        # mark features as available that another process (holding a lease for
+        # the same product) found available, without asking the library again
+        with self._features_lock:
+            for name in names:
+                name = encode_str(name)
+                bit = self._feature_bits.get(name)
+
+                # the features this process already knows about are up to date
+                if bit is None:
+                    bit = self._feature_bits[name] = 1 << len(self._feature_bits)
+                    self._features |= bit
+
+    def _refresh_features(self):
+        # recompute the bitset of the features compiled by guard(), this is
+        # also called from the lease callback so it mustn't take self._rwlock
+        with self._features_lock:
+            self._features_gen += 1
+            gen = self._features_gen
+            bits = list(self._feature_bits.items())
+
+        features = self._available_features(bits)
+        known = 0
+
+        for name, bit in bits:
+            known |= bit
+
+        with self._features_lock:
+            # drop the result if the features were cleared (or refreshed again)
+            # while asking the library, keep the bits added in the meantime
+            if gen == self._features_gen:
+                self._features = features | (self._features & ~known)
+
+    def _clear_features(self):
+        with self._features_lock:
+            self._features_gen += 1
+            self._features = 0
+
+    def _available_features(self, bits):
+        # the bitset of the (name, bit) pairs that are available
+        features = 0
+
+        if bits and self._has_lease():
+            for name, bit in bits:
+                if self._get_feature_value(name):
+                    features |= bit
+
+        return features
+
+    def _buffer(self, size):
+        # gets this thread's output buffer, growing it if it's smaller than size
+        buffers = _buffers
+        buf = getattr(buffers, "buf", None)
+
+        if buf is None or len(buf) < size:
+            buf = buffers.buf = wbuf(max(size, 256))
+            buffers.port = c_ushort(0)
+
+        return buf
+
+
+from turbofloat.manager import TurboFloatManager
+from turbofloat.shutdown import ShutdownCoordinator, ShutdownReport
+from turbofloat.trace import TraceRecorder, TraceReplayer, TraceRecord, read_trace
+from turbofloat.breaker import CircuitBreaker, CIRCUIT_CLOSED, CIRCUIT_OPEN, CIRCUIT_HALF_OPEN
+from turbofloat.handoff import HandoffServer, request_lease_with_handoff
+from turbofloat.journal import LeaseJournal, JournalRecord, JournalSummary, read_journal, summarize_journal
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2021 wyDay, LLC (https://wyday.com/)
+#
+# Current Author / maintainer:
+#
+#   Author: wyDay, LLC <support@wyday.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+import threading
+
+# the depth of unlocked() on each thread
+_unlocked = threading.local()
+
+
+class unlocked(object):
+
+    """
+    Skips every ReadWriteLock on this thread while the block runs. Used around
+    the lease callback, which runs on a TurboFloat library thread that a native
+    call made under the write lock may be waiting for.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        _unlocked.depth = getattr(_unlocked, "depth", 0) + 1
+        return self
+
+    def __exit__(self, *exc_info):
+        _unlocked.depth -= 1
+        return False
+
+
+def _skip_locks():
+    return getattr(_unlocked, "depth", 0) > 0
+
+
+class _ReadSide(object):
+
+    __slots__ = ("_lock",)
+
+    def __init__(self, lock):
+        self._lock = lock
+
+    def __enter__(self):
+        self._lock.acquire_read()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._lock.release_read()
+        return False
+
+
+class _WriteSide(_ReadSide):
+
+    __slots__ = ()
+
+    def __enter__(self):
+        self._lock.acquire_write()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._lock.release_write()
+        return False
+
+
+class ReadWriteLock(object):
+
+    """
+    A writer-preferring reader-writer lock. Any number of threads can hold
+    the read side at the same time, the write side is exclusive. Neither side
+    is re-entrant. Both sides are skipped by the threads running in an
+    unlocked() block.
+
+        with lock.read:
+            ...
+
+        with lock.write:
+            ...
+
+    It's built from plain locks (no Condition) because there's one per
+    TurboFloat handle. A waiting writer holds the turnstile, so new readers
+    queue up behind it instead of starving it.
+    """
+
+    __slots__ = ("_turnstile", "_readers_lock", "_write_lock", "_readers", "read", "write")
+
+    def __init__(self):
+        self._turnstile = threading.Lock()
+        self._readers_lock = threading.Lock()
+
+        # held by the writer, or by the readers as a group
+        self._write_lock = threading.Lock()
+        self._readers = 0
+
+        self.read = _ReadSide(self)
+        self.write = _WriteSide(self)
+
+    def acquire_read(self):
+        if _skip_locks():
+            return
+
+        with self._turnstile:
+            pass
+
+        with self._readers_lock:
+            self._readers += 1
+
+            if self._readers == 1:
+                self._write_lock.acquire()
+
+    def release_read(self):
+        if _skip_locks():
+            return
+
+        with self._readers_lock:
+            self._readers -= 1
+
+            if not self._readers:
+                self._write_lock.release()
+
+    def acquire_write(self):
+        if _skip_locks():
+            return
+
+        with self._turnstile:
+            self._write_lock.acquire()
+
+    def release_write(self):
+        if not _skip_locks():
+            self._write_lock.release()
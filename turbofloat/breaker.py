@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2021 wyDay, LLC (https://wyday.com/)
+#
+# Current Author / maintainer:
+#
+#   Author: wyDay, LLC <support@wyday.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+import copy
+import threading
+
+from turbofloat._compat import monotonic
+from turbofloat.c_wrapper import TurboFloatInetError
+
+#
+# Circuit breaker
+#
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half-open"
+
+
+class CircuitBreaker(object):
+
+    """
+    Stops lease requests from waiting out the network timeout over and over
+    while the TurboFloat Server is unreachable. Pass it as the circuit_breaker
+    argument of TurboFloat or TurboFloatManager (one breaker can be shared by
+    every handle that talks to the same server).
+
+    After failure_threshold network failures in a row (TurboFloatInetError and
+    its subclasses) the circuit opens and request_lease() immediately raises the
+    last network error. Once cooldown seconds have passed a single request is let
+    through as a probe: if it reaches the server the circuit closes, otherwise it
+    stays open for another cooldown.
+    """
+
+    def __init__(self, failure_threshold = 3, cooldown = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+
+        self._lock = threading.Lock()
+        self._state = CIRCUIT_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._last_error = None
+
+    @property
+    def state(self):
+        """CIRCUIT_CLOSED, CIRCUIT_OPEN, or CIRCUIT_HALF_OPEN (a probe is running)."""
+        return self._state
+
+    @property
+    def failures(self):
+        """The number of network failures in a row."""
+        return self._failures
+
+    @property
+    def last_error(self):
+        """The last network error, or None."""
+        return self._last_error
+
+    def before_call(self):
+        """
+        Raises the last network error if the circuit is open, otherwise lets the
+        call through (as the probe, once the cooldown has passed).
+        """
+        with self._lock:
+            if self._state == CIRCUIT_CLOSED:
+                return
+
+            now = monotonic()
+
+            # also let a new probe through if the last one never reported back
+            if now - self._opened_at >= self.cooldown:
+                self._state = CIRCUIT_HALF_OPEN
+                self._opened_at = now
+                return
+
+            # a copy, so the original traceback doesn't keep growing
+            raise copy.copy(self._last_error)
+
+    def on_success(self):
+        with self._lock:
+            self._state = CIRCUIT_CLOSED
+            self._failures = 0
+
+    def on_failure(self, error):
+        with self._lock:
+            if not isinstance(error, TurboFloatInetError):
+                # the server was reached, so the network is fine
+                self._state = CIRCUIT_CLOSED
+                self._failures = 0
+                return
+
+            self._failures += 1
+            self._last_error = error
+
+            if self._state == CIRCUIT_HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = CIRCUIT_OPEN
+                self._opened_at = monotonic()
+
+    def reset(self):
+        """Closes the circuit."""
+        self.on_success()
@@ -31,6 +31,7 @@ from ctypes import (
     c_uint32,
     c_char_p,
     c_wchar_p,
+    c_void_p,
     create_string_buffer,
     create_unicode_buffer,
     CFUNCTYPE
@@ -47,13 +48,59 @@ wbuf = create_unicode_buffer if is_win else create_string_buffer
 
 wstr_type = c_wchar_p if is_win else c_char_p
 
+wstr_empty = u"" if is_win else b""
+
+text_type = str if sys.version_info > (3, 0) else unicode
+
+# the number of encoded strings (GUIDs, feature names, etc.) to keep around
+encode_str_cache_size = 512
+
+
+def _encode_str(string):
+    """
+    Encodes a string (or pre-encoded UTF-8 bytes) the way the TurboFloat library
+    expects it, so it can be passed directly to the TF_* functions without
+    creating a ctypes object. Recently used strings are cached.
+    """
+    if is_win:
+        return string.decode('utf-8') if isinstance(string, bytes) else string
+
+    return string.encode('utf-8') if isinstance(string, text_type) else string
+
+
+def _dict_cache(maxsize):
+    # python 2.7 doesn't have lru_cache, so use a dict that starts over when it's full
+    def decorator(fn):
+        cache = {}
+
+        def cached(arg):
+            try:
+                return cache[arg]
+            except KeyError:
+                pass
+
+            if len(cache) >= maxsize:
+                cache.clear()
+
+            result = cache[arg] = fn(arg)
+            return result
+
+        return cached
+
+    return decorator
+
+
+try:
+    from functools import lru_cache as _lru_cache
+except ImportError:
+    _lru_cache = _dict_cache
+
+encode_str = _lru_cache(maxsize=encode_str_cache_size)(_encode_str)
+
 
 class wstr(wstr_type):
     def __init__(self, string):
-        if sys.version_info > (3, 0) and isinstance(string, str):
-            super(wstr, self).__init__(string.encode('utf-8') if not is_win else string)
-        else:
-            super(wstr, self).__init__(string)
+        super(wstr, self).__init__(encode_str(string))
 
 
 # Wrapper
@@ -167,6 +214,8 @@ TF_CB_LEASE_REGAINED = 0x00000005
 
 LeaseCallback = CFUNCTYPE(None, c_uint32)
 
+LeaseCallbackEx = CFUNCTYPE(None, c_uint32, c_void_p)
+
 def load_library(path):
 
     if sys.platform == 'win32' or sys.platform == 'cygwin':
@@ -184,52 +233,10 @@ def validate_result(return_code):
         return
 
     # Raise an exception type appropriate for the kind of error
-    if return_code == TF_FAIL:
-        raise TurboFloatFailError()
-    elif return_code == TF_E_SERVER:
-        raise TurboFloatServerError()
-    elif return_code == TF_E_NO_CALLBACK:
-        raise TurboFloatNoCallbackError()
-    elif return_code == TF_E_NO_FREE_LEASES:
-        raise TurboFloatNoFreeLeasesError()
-    elif return_code == TF_E_LEASE_EXISTS:
-        raise TurboFloatLeaseExistsError()
-    elif return_code == TF_E_WRONG_TIME:
-        raise TurboFloatWrongTimeError()
-    elif return_code == TF_E_NO_LEASE:
-        raise TurboFloatNoLeaseError()
-    elif return_code == TF_E_PDETS:
-        raise TurboFloatDatFileError()
-    elif return_code == TF_E_INVALID_FLAGS:
-        raise TurboFloatFlagsError()
-    elif return_code == TF_E_WRONG_SERVER_PRODUCT:
-        raise TurboFloatWrongServerProductError()
-    elif return_code == TF_E_UPGRADE_LIBRARY:
-        raise TurboFloatUpgradeLibraryError()
-    elif return_code == TF_E_USERNAME_NOT_ALLOWED:
-        raise TurboFloatUsernameNotAllowedError()
-    elif return_code == TF_E_BAD_HOST_ADDRESS:
-        raise TurboFloatBadHostAddressError()
-    elif return_code == TF_E_CLIENT_IPC:
-        raise TurboFloatClientIPCError()
-    elif return_code == TF_E_SERVER_UUID_MISMATCH:
-        raise TurboFloatServerUUIDMismatchError()
-    elif return_code == TF_E_COM:
-        raise TurboFloatComError()
-    elif return_code == TF_E_INET:
-        raise TurboFloatInetError()
-    elif return_code == TF_E_PERMISSION:
-        raise TurboFloatPermissionError()
-    elif return_code == TF_E_INVALID_HANDLE:
-        raise TurboFloatInvalidHandleError()
-    elif return_code == TF_E_ENABLE_NETWORK_ADAPTERS:
-        raise TurboFloatEnableNetworkAdaptersError()
-    elif return_code == TF_E_BROKEN_WMI:
-        raise TurboFloatBrokenWMIError()
-    elif return_code == TF_E_INET_TIMEOUT:
-        raise TurboFloatInetTimeoutError()
-    elif return_code == TF_E_INET_TLS:
-        raise TurboFloatInetTLSError()
+    error = result_errors.get(return_code)
+
+    if error is not None:
+        raise error()
 
     # Otherwise bail out and raise a generic exception
     raise TurboFloatError(return_code)
@@ -269,6 +276,17 @@ class TurboFloatInetTLSError(TurboFloatInetError):
     certificate error. More information here: https://wyday.com/limelm/help/faq/#internet-error"""
     pass
 
+class TurboFloatFeatureError(TurboFloatError):
+
+    """
+    One or more features required by a feature guard aren't available. Either
+    there's no active lease or the lease doesn't include the features.
+    """
+
+    def __init__(self, features):
+        super(TurboFloatFeatureError, self).__init__("Features not available: " + ", ".join(map(str, features)))
+        self.features = features
+
 class TurboFloatServerError(TurboFloatError):
 
     """
@@ -459,3 +477,44 @@ class TurboFloatBrokenWMIError(TurboFloatError):
     https://wyday.com/limelm/help/faq/#fix-broken-wmi
     """
     pass
+
+
+# The exception type raised by validate_result() for each return code
+
+result_errors = {
+    TF_FAIL: TurboFloatFailError,
+    TF_E_SERVER: TurboFloatServerError,
+    TF_E_NO_CALLBACK: TurboFloatNoCallbackError,
+    TF_E_NO_FREE_LEASES: TurboFloatNoFreeLeasesError,
+    TF_E_LEASE_EXISTS: TurboFloatLeaseExistsError,
+    TF_E_WRONG_TIME: TurboFloatWrongTimeError,
+    TF_E_NO_LEASE: TurboFloatNoLeaseError,
+    TF_E_PDETS: TurboFloatDatFileError,
+    TF_E_INVALID_FLAGS: TurboFloatFlagsError,
+    TF_E_WRONG_SERVER_PRODUCT: TurboFloatWrongServerProductError,
+    TF_E_UPGRADE_LIBRARY: TurboFloatUpgradeLibraryError,
+    TF_E_USERNAME_NOT_ALLOWED: TurboFloatUsernameNotAllowedError,
+    TF_E_BAD_HOST_ADDRESS: TurboFloatBadHostAddressError,
+    TF_E_CLIENT_IPC: TurboFloatClientIPCError,
+    TF_E_SERVER_UUID_MISMATCH: TurboFloatServerUUIDMismatchError,
+    TF_E_COM: TurboFloatComError,
+    TF_E_INET: TurboFloatInetError,
+    TF_E_PERMISSION: TurboFloatPermissionError,
+    TF_E_INVALID_HANDLE: TurboFloatInvalidHandleError,
+    TF_E_ENABLE_NETWORK_ADAPTERS: TurboFloatEnableNetworkAdaptersError,
+    TF_E_BROKEN_WMI: TurboFloatBrokenWMIError,
+    TF_E_INET_TIMEOUT: TurboFloatInetTimeoutError,
+    TF_E_INET_TLS: TurboFloatInetTLSError
+}
+
+_error_codes = dict((error, code) for code, error in result_errors.items())
+
+
+def error_code(error):
+    """Gets the TF_* return code of an exception raised by validate_result()."""
+    code = _error_codes.get(type(error))
+
+    if code is None and error.args and isinstance(error.args[0], int):
+        code = error.args[0]
+
+    return code
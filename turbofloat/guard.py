@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2021 wyDay, LLC (https://wyday.com/)
+#
+# Current Author / maintainer:
+#
+#   Author: wyDay, LLC <support@wyday.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+from functools import wraps
+
+from turbofloat.c_wrapper import TurboFloatFeatureError, encode_str
+
+#
+# Feature guards
+#
+
+
+class FeatureGuard(object):
+
+    """
+    Checks that a set of features is available for the current lease. Create
+    it with TurboFloat.guard(...) and use it as a decorator, a context manager,
+    or call check() directly:
+
+        export_guard = tf.guard("export", "batch")
+
+        @export_guard
+        def export():
+            ...
+
+        with export_guard:
+            ...
+
+    The feature names are compiled to a bitmask once, so every check is just an
+    integer AND against the feature bitset that TurboFloat recomputes when the
+    lease is acquired, lost, or the features change.
+    """
+
+    __slots__ = ("_tf", "mask", "names")
+
+    def __init__(self, tf, mask, names):
+        self._tf = tf
+        self.mask = mask
+        self.names = names
+
+    def check(self):
+        """Raises TurboFloatFeatureError if any of the features isn't available."""
+        if self._tf._features & self.mask != self.mask:
+            raise TurboFloatFeatureError(self.missing())
+
+    def missing(self):
+        """Gets the names of the features that aren't available."""
+        features = self._tf._features
+        bits = self._tf._feature_bits
+
+        return [name for name in self.names if not features & bits[encode_str(name)]]
+
+    def __bool__(self):
+        return self._tf._features & self.mask == self.mask
+
+    __nonzero__ = __bool__
+
+    def __enter__(self):
+        self.check()
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __call__(self, fn):
+        @wraps(fn)
+        def guarded(*args, **kwargs):
+            self.check()
+            return fn(*args, **kwargs)
+
+        return guarded
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2021 wyDay, LLC (https://wyday.com/)
+#
+# Current Author / maintainer:
+#
+#   Author: wyDay, LLC <support@wyday.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+import json
+import os
+import socket
+import threading
+
+from turbofloat.c_wrapper import (
+    TurboFloatError,
+    TurboFloatNoFreeLeasesError,
+    TurboFloatNoLeaseError
+)
+
+#
+# Lease handoff between process generations
+#
+# The protocol is newline-delimited JSON over a Unix domain socket:
+#
+#   new -> old   {"op": "release"}
+#   old -> new   {"features": [names of the available guarded features]}
+#   old -> new   {"released": true/false, "error": null or the drop error}
+#
+# After a successful drop the old process stops listening (and removes the
+# socket file) before it sends the final message, so the new process can start
+# its own HandoffServer at the same path right after the handoff. If the drop
+# failed the old process keeps its lease and keeps listening.
+#
+
+
+def _check_platform():
+    if not hasattr(socket, "AF_UNIX"):
+        raise NotImplementedError("Lease handoff needs Unix domain sockets, which aren't available on this platform.")
+
+
+def _send(sock, message):
+    sock.sendall(json.dumps(message).encode("utf-8") + b"\n")
+
+
+def _recv(f):
+    line = f.readline()
+
+    if not line:
+        raise TurboFloatError("The lease handoff connection was closed.")
+
+    return json.loads(line.decode("utf-8"))
+
+
+class HandoffServer(object):
+
+    """
+    Lets the next generation of this process take over the lease. Start it in
+    the process that holds the lease:
+
+        server = HandoffServer(tf, "/run/myapp/lease.sock", on_released = shutdown)
+        server.start()
+
+    When the new process asks for the lease, the available guarded features are
+    sent to it, the lease is dropped, and on_released() (if given) is called.
+    If the lease can't be dropped the server keeps running and on_released()
+    isn't called.
+    """
+
+    def __init__(self, tf, path, on_released = None, timeout = 10.0):
+        _check_platform()
+
+        self.path = path
+        self.timeout = timeout
+
+        self._tf = tf
+        self._on_released = on_released
+        self._sock = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        # remove a socket file left behind by a process that crashed
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.path)
+        self._sock.listen(1)
+
+        self._thread = threading.Thread(target=self._serve)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stops listening and removes the socket file."""
+        with self._lock:
+            sock, self._sock = self._sock, None
+
+            if sock is None:
+                return
+
+            sock.close()
+
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    def _serve(self):
+        while True:
+            sock = self._sock
+
+            if sock is None:
+                return
+
+            try:
+                conn, _ = sock.accept()
+            except (socket.error, OSError):
+                # stopped
+                return
+
+            try:
+                conn.settimeout(self.timeout)
+
+                if self._hand_off(conn):
+                    return
+            except (socket.error, OSError, ValueError, TurboFloatError):
+                # a broken handoff leaves the lease with this process
+                pass
+            finally:
+                conn.close()
+
+    def _hand_off(self, conn):
+        request = _recv(conn.makefile("rb"))
+
+        if request.get("op") != "release":
+            return False
+
+        _send(conn, {"features": self._tf._export_features()})
+
+        error = None
+
+        try:
+            self._tf.drop_lease()
+        except TurboFloatNoLeaseError:
+            pass
+        except TurboFloatError as e:
+            error = repr(e)
+
+        if error is not None:
+            _send(conn, {"released": False, "error": error})
+            return False
+
+        self.stop()
+
+        _send(conn, {"released": True, "error": None})
+
+        if self._on_released is not None:
+            self._on_released()
+
+        return True
+
+
+def request_lease_with_handoff(tf, path, timeout = 10.0):
+    """
+    Requests a lease and then takes over from the previous generation of this
+    process (a HandoffServer listening at path), if there is one.
+
+    The lease is requested first, so the seat is never given up. Only if there
+    are no free leases is the old process asked to release its lease before the
+    lease is requested again. The guarded features that were available to the
+    old process are then imported, so feature guards work immediately.
+
+    Returns True if a previous process handed off its lease, False if there was
+    no previous process (or it couldn't release its lease, but a lease was
+    acquired anyway). Raises the error of request_lease() if no lease could be
+    acquired, or a TurboFloatError if the previous process couldn't release its
+    lease for this process (including when it timed out or hung up).
+    """
+    _check_platform()
+
+    try:
+        tf.request_lease()
+        acquired = True
+    except TurboFloatNoFreeLeasesError:
+        acquired = False
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+
+    try:
+        try:
+            sock.connect(path)
+        except (socket.error, OSError):
+            # there's no previous process to take over from
+            if not acquired:
+                tf.request_lease()
+
+            return False
+
+        try:
+            f = sock.makefile("rb")
+
+            _send(sock, {"op": "release"})
+            features = _recv(f).get("features", [])
+            reply = _recv(f)
+        except (socket.error, OSError, ValueError, TurboFloatError) as e:
+            # the previous process hung up, timed out, or sent garbage
+            if acquired:
+                return False
+
+            if isinstance(e, TurboFloatError):
+                raise
+
+            raise TurboFloatError("The lease handoff failed: %r" % e)
+    finally:
+        sock.close()
+
+    if not reply.get("released"):
+        if acquired:
+            return False
+
+        raise TurboFloatError("The previous process couldn't release its lease: %s" % reply.get("error"))
+
+    # a lease that was acquired straight away already has its features from the library
+    if not acquired:
+        tf.request_lease()
+        tf._import_features(features)
+
+    return True
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2021 wyDay, LLC (https://wyday.com/)
+#
+# Current Author / maintainer:
+#
+#   Author: wyDay, LLC <support@wyday.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+from collections import namedtuple
+
+import mmap
+import os
+import struct
+import threading
+import time
+
+from turbofloat.c_wrapper import (
+    TF_CB_EXPIRED,
+    TF_CB_EXPIRED_INET,
+    TF_CB_LEASE_DROPPED,
+    TF_CB_LEASE_DROPPED_SLEEP,
+    TF_CB_LEASE_REGAINED,
+    error_code
+)
+
+#
+# Lease event journal
+#
+
+# Journal events
+JOURNAL_REQUEST = 0
+JOURNAL_GRANT = 1
+JOURNAL_REQUEST_FAILED = 2
+JOURNAL_CALLBACK = 3
+JOURNAL_DROP = 4
+JOURNAL_CLEANUP = 5
+
+# the code stored when an error doesn't have a TF_* return code (or it doesn't fit)
+JOURNAL_UNKNOWN_CODE = 0xFFFF
+
+_LEASE_LOST = (TF_CB_EXPIRED, TF_CB_EXPIRED_INET, TF_CB_LEASE_DROPPED, TF_CB_LEASE_DROPPED_SLEEP)
+
+_MAGIC = b"TFJRNL01"
+
+# magic, record size, capacity, number of records ever written
+_HEADER = struct.Struct("<8sIIQ")
+
+# time (seconds since the epoch), process id, handle, event, TF_* code or TF_CB_* status
+_RECORD = struct.Struct("<dIiHH")
+
+
+class JournalRecord(namedtuple("JournalRecord", "time pid handle event code")):
+
+    """One lease lifecycle event read from a lease journal."""
+
+    __slots__ = ()
+
+
+class LeaseJournal(object):
+
+    """
+    An append-only journal of lease lifecycle events (request, grant, request
+    failure, every lease callback status, drop, and cleanup) stored as
+    fixed-size binary records in a memory-mapped ring file. Once the file holds
+    capacity records the oldest records are overwritten.
+
+    Pass it as the journal argument of TurboFloat or TurboFloatManager. A
+    journal file should only be written by one process at a time.
+    """
+
+    def __init__(self, path, capacity = 65536):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+        size = _HEADER.size + capacity * _RECORD.size
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+
+        self._file = open(path, "r+b" if exists else "w+b")
+        count = 0
+
+        if exists:
+            header = self._file.read(_HEADER.size)
+
+            if len(header) == _HEADER.size:
+                magic, record_size, file_capacity, count = _HEADER.unpack(header)
+
+            # never overwrite a file that isn't a journal (e.g. a mistyped path)
+            if len(header) != _HEADER.size or magic != _MAGIC or record_size != _RECORD.size:
+                self._file.close()
+                raise ValueError("Not a TurboFloat lease journal: %s" % path)
+
+            # keep appending to the existing journal
+            capacity = file_capacity
+            size = _HEADER.size + capacity * _RECORD.size
+
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+
+        self.capacity = capacity
+        self._count = count
+
+        _HEADER.pack_into(self._map, 0, _MAGIC, _RECORD.size, capacity, count)
+
+    def record(self, handle, event, code = 0):
+        """Appends an event (one of the JOURNAL_* values) for the handle."""
+        if not 0 <= code < JOURNAL_UNKNOWN_CODE:
+            code = JOURNAL_UNKNOWN_CODE
+
+        with self._lock:
+            if self._map is None:
+                return
+
+            offset = _HEADER.size + (self._count % self.capacity) * _RECORD.size
+            _RECORD.pack_into(self._map, offset, time.time(), self._pid, handle, event, code)
+
+            self._count += 1
+            _HEADER.pack_into(self._map, 0, _MAGIC, _RECORD.size, self.capacity, self._count)
+
+    def record_error(self, handle, event, error):
+        code = error_code(error)
+        self.record(handle, event, JOURNAL_UNKNOWN_CODE if code is None else code)
+
+    def flush(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.flush()
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.flush()
+                self._map.close()
+                self._file.close()
+                self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_journal(path):
+    """Reads the records of a lease journal, oldest first."""
+
+    with open(path, "rb") as f:
+        data = f.read()
+
+    magic, record_size, capacity, count = _HEADER.unpack_from(data, 0)
+
+    if magic != _MAGIC or record_size != _RECORD.size:
+        raise ValueError("Not a TurboFloat lease journal: %s" % path)
+
+    first = max(0, count - capacity)
+
+    return [JournalRecord(*_RECORD.unpack_from(data, _HEADER.size + (i % capacity) * _RECORD.size))
+            for i in range(first, count)]
+
+
+class JournalSummary(object):
+
+    """
+    Seat usage aggregated from lease journal records by summarize_journal().
+
+    seat_hold_time  The total number of seconds leases were held.
+    acquire_times   The seconds from each request to the lease being granted.
+    outages         (pid, handle, start, end) for each time a held lease was lost,
+                    end is None if the lease wasn't regained.
+    """
+
+    __slots__ = ("seat_hold_time", "acquire_times", "outages")
+
+    def __init__(self):
+        self.seat_hold_time = 0.0
+        self.acquire_times = []
+        self.outages = []
+
+
+def summarize_journal(records, until = None):
+    """
+    Aggregates journal records (e.g. from read_journal()) into a JournalSummary.
+    Leases that are still held are counted up to until (the time of the last
+    record if not given).
+    """
+    summary = JournalSummary()
+
+    # per (pid, handle): [held since, requested at, lost at]
+    states = {}
+
+    records = sorted(records, key=lambda r: r.time)
+
+    if until is None:
+        until = records[-1].time if records else 0.0
+
+    for r in records:
+        state = states.setdefault((r.pid, r.handle), [None, None, None])
+        held, requested, lost = state
+
+        granted = r.event == JOURNAL_GRANT or (r.event == JOURNAL_CALLBACK and r.code == TF_CB_LEASE_REGAINED)
+
+        if r.event == JOURNAL_REQUEST:
+            if requested is None:
+                state[1] = r.time
+        elif granted:
+            if held is None:
+                state[0] = r.time
+
+            if r.event == JOURNAL_GRANT and requested is not None:
+                summary.acquire_times.append(r.time - requested)
+
+            if lost is not None:
+                summary.outages.append((r.pid, r.handle, lost, r.time))
+
+            state[1] = state[2] = None
+        elif r.event == JOURNAL_REQUEST_FAILED:
+            state[1] = None
+        elif r.event == JOURNAL_CALLBACK and r.code in _LEASE_LOST:
+            if held is not None:
+                summary.seat_hold_time += r.time - held
+                state[0] = None
+                state[2] = r.time
+        elif r.event == JOURNAL_DROP or r.event == JOURNAL_CLEANUP:
+            if held is not None:
+                summary.seat_hold_time += r.time - held
+
+            # dropping the lease on purpose ends an outage
+            if lost is not None:
+                summary.outages.append((r.pid, r.handle, lost, r.time))
+
+            state[0] = state[1] = state[2] = None
+
+    for (pid, handle), (held, requested, lost) in states.items():
+        if held is not None:
+            summary.seat_hold_time += max(0.0, until - held)
+
+        if lost is not None:
+            summary.outages.append((pid, handle, lost, None))
+
+    return summary
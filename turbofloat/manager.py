@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2021 wyDay, LLC (https://wyday.com/)
+#
+# Current Author / maintainer:
+#
+#   Author: wyDay, LLC <support@wyday.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+from collections import deque
+from ctypes import c_void_p
+
+import os
+import threading
+
+from turbofloat import (
+    TurboFloat,
+    _exec_file_loc,
+    _load_dat_file,
+    _set_restype
+)
+from turbofloat.journal import JOURNAL_CLEANUP
+from turbofloat.c_wrapper import (
+    LeaseCallbackEx,
+    load_library
+)
+
+#
+# Multi-product interface
+#
+
+
+class _Tenant(object):
+
+    """Per-product state kept by the TurboFloatManager."""
+
+    __slots__ = ("guid", "tf", "status")
+
+    def __init__(self, guid, tf):
+        self.guid = guid
+        self.tf = tf
+        self.status = None
+
+
+class TurboFloatManager(object):
+
+    """
+    Manages TurboFloat handles for many products (GUIDs) in one process.
+
+    The TurboFloat library is loaded once, handles are only created the first
+    time a GUID is used, and every handle shares a single native lease callback
+    that routes the callback status to the TurboFloat instance it belongs to.
+    """
+
+    def __init__(self, callback = None, dat_file_loc = "", library_folder = "", recorder = None, journal = None,
+                 circuit_breaker = None, circuit_breaker_factory = None):
+        """
+        The optional callback is called as callback(guid, status) for every
+        product that wasn't given its own callback in get().
+
+        The dat_file_loc is the default TurboActivate.dat used for products
+        that weren't given their own dat file in get().
+
+        The optional recorder (a TraceRecorder) records every TF_* call and
+        lease callback made through this manager.
+
+        The optional journal (a LeaseJournal) records every lease lifecycle
+        event of every product.
+
+        The optional circuit_breaker (a CircuitBreaker) is shared by every
+        product, so requests fail fast while the TurboFloat Server is unreachable.
+        Only share a breaker when every product uses the same TurboFloat Server,
+        otherwise an outage of one server fails the requests of every product.
+
+        The optional circuit_breaker_factory is called as
+        circuit_breaker_factory(guid) to create a CircuitBreaker for each
+        product (e.g. CircuitBreaker) and is used instead of circuit_breaker.
+        """
+
+        execFileLoc = _exec_file_loc()
+
+        if not library_folder:
+            library_folder = execFileLoc
+
+        if not dat_file_loc:
+            dat_file_loc = os.path.join(execFileLoc, "TurboActivate.dat")
+
+        self._lib = load_library(library_folder)
+
+        if recorder is not None:
+            self._lib = recorder.wrap(self._lib)
+
+        _set_restype(self._lib)
+
+        self._callback = callback
+        self._journal = journal
+        self._circuit_breaker = circuit_breaker
+        self._circuit_breaker_factory = circuit_breaker_factory
+        self._dat_file_loc = dat_file_loc
+        self._dat_files = set()
+
+        self._tenants = {}
+        self._lock = threading.Lock()
+
+        # the one native callback shared by every handle, the user pointer
+        # is the tenant's key in self._routes. Keys are never reused, so a
+        # late callback for a handle freed by cleanup() can't reach a new one.
+        self._routes = {}
+        self._next_route = 1
+        self._trampoline = LeaseCallbackEx(self._route)
+
+    def get(self, guid, callback = None, dat_file_loc = ""):
+        """
+        Gets the TurboFloat instance for the product GUID, creating the handle
+        the first time the GUID is used. The callback (if any) is called as
+        callback(status) and is only used when the handle is created.
+        """
+
+        tenant = self._tenants.get(guid)
+
+        if tenant is None:
+            with self._lock:
+                tenant = self._tenants.get(guid)
+
+                if tenant is None:
+                    tenant = self._add(guid, callback, dat_file_loc or self._dat_file_loc)
+
+        return tenant.tf
+
+    def handles(self):
+        """Gets the TurboFloat instances for every product created so far."""
+        return [tenant.tf for tenant in list(self._routes.values())]
+
+    def last_status(self, guid):
+        """
+        Gets the last lease callback status (TF_CB_*) received for the product
+        GUID, or None if no callback has been received.
+        """
+        tenant = self._tenants.get(guid)
+
+        return tenant.status if tenant is not None else None
+
+    def request_leases(self, guids, max_workers = 8):
+        """
+        Requests leases for many products concurrently using at most max_workers
+        threads. Returns a dict of GUID to None (the lease was acquired) or the
+        exception that was raised for that product.
+        """
+
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+
+        pending = deque()
+        results = {}
+
+        for guid in guids:
+            if guid not in results:
+                results[guid] = None
+                pending.append(guid)
+
+        def worker():
+            while True:
+                try:
+                    guid = pending.popleft()
+                except IndexError:
+                    return
+
+                try:
+                    self.get(guid).request_lease()
+                except Exception as e:
+                    results[guid] = e
+
+        threads = [threading.Thread(target=worker) for _ in range(min(max_workers, len(pending)))]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        return results
+
+    def cleanup(self):
+        """
+        Frees all of the open handles. If you have active leases then you
+        should drop them before calling this.
+        """
+        with self._lock:
+            tenants = list(self._routes.values())
+
+            # stop re-acquiring leases on the handles that are about to be freed
+            for tenant in tenants:
+                tenant.tf.stop_supervisor()
+
+            # TF_Cleanup() frees every handle, so wait for all of them to be idle
+            locks = [tenant.tf._rwlock for tenant in tenants]
+
+            for lock in locks:
+                lock.acquire_write()
+
+            try:
+                self._lib.TF_Cleanup()
+
+                if self._journal is not None:
+                    for tenant in tenants:
+                        self._journal.record(tenant.tf._handle, JOURNAL_CLEANUP)
+            finally:
+                for lock in locks:
+                    lock.release_write()
+
+            self._tenants = {}
+            self._routes = {}
+
+    def _add(self, guid, callback, dat_file_loc):
+        if dat_file_loc not in self._dat_files:
+            _load_dat_file(self._lib, dat_file_loc)
+            self._dat_files.add(dat_file_loc)
+
+        if callback is None and self._callback is not None:
+            callback = self._guid_callback(guid)
+
+        tenant = _Tenant(guid, TurboFloat._from_library(self._lib, guid, callback))
+        tenant.tf._journal = self._journal
+        factory = self._circuit_breaker_factory
+        tenant.tf._circuit_breaker = factory(guid) if factory is not None else self._circuit_breaker
+
+        route = self._next_route
+        self._next_route += 1
+
+        self._lib.TF_SetLeaseCallbackEx(tenant.tf._handle, self._trampoline, c_void_p(route))
+
+        self._routes[route] = tenant
+        self._tenants[guid] = tenant
+
+        return tenant
+
+    def _guid_callback(self, guid):
+        default = self._callback
+
+        def callback(status):
+            default(guid, status)
+
+        return callback
+
+    def _route(self, status, user_ptr):
+        tenant = self._routes.get(user_ptr)
+
+        # the handle was freed by cleanup()
+        if tenant is None:
+            return
+
+        tenant.status = status
+        tenant.tf._lease_callback(status)
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2021 wyDay, LLC (https://wyday.com/)
+#
+# Current Author / maintainer:
+#
+#   Author: wyDay, LLC <support@wyday.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+import atexit
+import os
+import signal
+import threading
+
+from turbofloat._compat import monotonic
+from turbofloat.c_wrapper import TurboFloatNoLeaseError
+
+#
+# Shutdown
+#
+
+# the results of a drop that didn't raise an exception
+_DROPPED = object()
+_NO_LEASE = object()
+
+
+class ShutdownReport(object):
+
+    """
+    The result of ShutdownCoordinator.shutdown().
+
+    dropped     The TurboFloat instances whose lease was dropped.
+    failed          A dict of TurboFloat instance to the exception (usually a
+                    TurboFloatError) raised while dropping its lease.
+    unfinished      The TurboFloat instances whose drop didn't finish before
+                    the deadline.
+    cleaned_up      Whether TF_Cleanup() was called and succeeded. It's skipped
+                    when drops are unfinished, because it would free handles
+                    that are still in use.
+    cleanup_errors  A dict of registered TurboFloat or TurboFloatManager
+                    instance to the exception raised by its cleanup().
+    """
+
+    __slots__ = ("dropped", "failed", "unfinished", "cleaned_up", "cleanup_errors")
+
+    def __init__(self):
+        self.dropped = []
+        self.failed = {}
+        self.unfinished = []
+        self.cleaned_up = False
+        self.cleanup_errors = {}
+
+
+class ShutdownCoordinator(object):
+
+    """
+    Drops the leases of every registered TurboFloat instance (or every handle
+    of a registered TurboFloatManager) in parallel under one deadline, and then
+    calls TF_Cleanup() once.
+
+    Use install() to run the shutdown automatically at exit and on SIGTERM.
+    """
+
+    def __init__(self, timeout = 5.0, reporter = None):
+        """
+        The timeout is the overall deadline (in seconds) for dropping all of the
+        leases. The optional reporter is called with the ShutdownReport.
+        """
+        self.timeout = timeout
+        self.reporter = reporter
+        self.report = None
+
+        self._sources = []
+        self._lock = threading.Lock()
+        self._previous_sigterm = None
+
+    def register(self, source):
+        """Registers a TurboFloat or TurboFloatManager instance."""
+        with self._lock:
+            if source not in self._sources:
+                self._sources.append(source)
+
+        return source
+
+    def unregister(self, source):
+        with self._lock:
+            if source in self._sources:
+                self._sources.remove(source)
+
+    def install(self, at_exit = True, sigterm = True):
+        """
+        Runs shutdown() when the interpreter exits and/or when the process
+        receives SIGTERM. The SIGTERM handler can only be installed from the
+        main thread. After shutting down, the previous SIGTERM handler is called
+        (or, if there was none, the process is terminated by SIGTERM as usual).
+        """
+        if at_exit:
+            atexit.register(self.shutdown)
+
+        if sigterm and hasattr(signal, "SIGTERM"):
+            self._previous_sigterm = signal.signal(signal.SIGTERM, self._on_sigterm)
+
+    def shutdown(self, timeout = None):
+        """
+        Drops all the leases and frees the handles. Only the first call does
+        any work, later calls return the same ShutdownReport.
+        """
+        with self._lock:
+            if self.report is not None:
+                return self.report
+
+            self.report = report = ShutdownReport()
+            sources = list(self._sources)
+
+        deadline = monotonic() + (self.timeout if timeout is None else timeout)
+
+        handles = []
+
+        for source in sources:
+            handles.extend(source.handles() if hasattr(source, "handles") else [source])
+
+        threads = []
+
+        for tf in handles:
+            # each drop writes only to its own result, and only the results of
+            # the drops that finished in time make it into the report
+            result = []
+            thread = threading.Thread(target=self._drop, args=(tf, result))
+            thread.daemon = True
+            thread.start()
+            threads.append((tf, thread, result))
+
+        for tf, thread, result in threads:
+            thread.join(max(0.0, deadline - monotonic()))
+
+            if thread.is_alive() or not result:
+                report.unfinished.append(tf)
+            elif result[0] is _DROPPED:
+                report.dropped.append(tf)
+            elif result[0] is not _NO_LEASE:
+                report.failed[tf] = result[0]
+
+        if not report.unfinished:
+            self._cleanup(sources, report)
+            report.cleaned_up = not report.cleanup_errors
+
+        if self.reporter is not None:
+            self.reporter(report)
+
+        return report
+
+    def _drop(self, tf, result):
+        try:
+            tf.drop_lease()
+            result.append(_DROPPED)
+        except TurboFloatNoLeaseError:
+            result.append(_NO_LEASE)
+        except Exception as e:
+            result.append(e)
+
+    def _cleanup(self, sources, report):
+        # TF_Cleanup() frees the handles of the whole library,
+        # so only call it once per loaded library
+        cleaned = set()
+
+        for source in sources:
+            lib = getattr(source._lib, "_handle", id(source._lib))
+
+            if lib not in cleaned:
+                cleaned.add(lib)
+
+                try:
+                    source.cleanup()
+                except Exception as e:
+                    report.cleanup_errors[source] = e
+
+    def _on_sigterm(self, signum, frame):
+        try:
+            self.shutdown()
+        finally:
+            # the process must still terminate, even if the shutdown failed
+            previous = self._previous_sigterm
+
+            if callable(previous):
+                previous(signum, frame)
+            elif previous != signal.SIG_IGN:
+                signal.signal(signum, signal.SIG_DFL)
+                os.kill(os.getpid(), signum)
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2021 wyDay, LLC (https://wyday.com/)
+#
+# Current Author / maintainer:
+#
+#   Author: wyDay, LLC <support@wyday.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+import logging
+import random
+import threading
+
+from turbofloat._compat import monotonic
+from turbofloat.c_wrapper import (
+    TF_CB_EXPIRED_INET,
+    TF_CB_LEASE_DROPPED,
+    TF_CB_LEASE_REGAINED,
+    TurboFloatError,
+    TurboFloatLeaseExistsError
+)
+
+#
+# Lease supervisor
+#
+
+_log = logging.getLogger(__name__)
+
+
+class LeaseSupervisor(object):
+
+    """
+    Re-acquires the lease in the background after it's lost. Start it with
+    TurboFloat.start_supervisor().
+
+    When the lease callback reports one of the statuses (by default
+    TF_CB_EXPIRED_INET and TF_CB_LEASE_DROPPED) the supervisor thread requests
+    the lease again with capped exponential backoff: the first attempt is made
+    after about initial_delay seconds and the delay doubles after every failed
+    attempt, up to max_delay. Each delay is randomized between half and the full
+    delay so many clients don't retry at the same moment.
+
+    Once the lease is regained every subscriber is called as
+    subscriber(attempts, recovery_time) from the supervisor thread, where
+    recovery_time is the seconds since the lease was lost. Exceptions raised by
+    subscribers are logged and don't stop the supervisor.
+
+    Calling drop_lease() cancels a running recovery.
+    """
+
+    def __init__(self, tf, initial_delay = 1.0, max_delay = 60.0,
+                 statuses = (TF_CB_EXPIRED_INET, TF_CB_LEASE_DROPPED)):
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.statuses = statuses
+
+        # the attempts of the running (or last) recovery
+        self.attempts = 0
+        self.last_error = None
+        self.last_recovery_time = None
+
+        self._tf = tf
+        self._subscribers = []
+        self._lost_at = None
+        self._lost = threading.Event()
+        self._stop = threading.Event()
+
+        # set when the thread has something to do (a lost lease or stop())
+        self._wake = threading.Event()
+        self._thread = None
+
+    @property
+    def recovering(self):
+        """Whether the lease was lost and is being re-acquired."""
+        return self._lost.is_set() and not self._stop.is_set()
+
+    def subscribe(self, subscriber):
+        self._subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self._subscribers.remove(subscriber)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout = None):
+        """
+        Stops the supervisor thread. A timeout of 0 doesn't wait for a running
+        lease request to finish.
+        """
+        self._stop.set()
+        self._lost.clear()
+
+        # wake up the thread if it's waiting for a lost lease
+        self._wake.set()
+
+        if self._thread is not None and self._thread is not threading.current_thread() and timeout != 0:
+            self._thread.join(timeout)
+
+    def _on_lease_status(self, status):
+        if status in self.statuses:
+            if not self._lost.is_set():
+                self._lost_at = monotonic()
+                self.attempts = 0
+                self._lost.set()
+                self._wake.set()
+        elif status == TF_CB_LEASE_REGAINED:
+            # TurboFloat regained the lease itself (e.g. after sleep)
+            self._lost.clear()
+
+    def _cancel(self):
+        self._lost.clear()
+
+    def _start_attempt(self):
+        # called under the TurboFloat write lock right before the lease request,
+        # so a loss reported while the request runs starts another recovery
+        if not self.recovering:
+            return False
+
+        self._lost.clear()
+        return True
+
+    def _attempt_failed(self):
+        if not self._stop.is_set():
+            self._lost.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait()
+            self._wake.clear()
+
+            delay = self.initial_delay
+
+            while self._lost.is_set() and not self._stop.is_set():
+                if self._stop.wait(delay * random.uniform(0.5, 1.0)):
+                    return
+
+                self.attempts += 1
+                attempts = self.attempts
+                lost_at = self._lost_at
+
+                try:
+                    if not self._tf._recover_lease(self):
+                        # cancelled
+                        break
+                except TurboFloatLeaseExistsError:
+                    pass
+                except Exception as e:
+                    if not isinstance(e, TurboFloatError):
+                        _log.exception("Unexpected error while re-acquiring the TurboFloat lease")
+
+                    self.last_error = e
+                    delay = min(delay * 2, self.max_delay)
+                    continue
+
+                self.last_recovery_time = monotonic() - lost_at
+
+                for subscriber in list(self._subscribers):
+                    try:
+                        subscriber(attempts, self.last_recovery_time)
+                    except Exception:
+                        _log.exception("TurboFloat lease supervisor subscriber %r failed", subscriber)
+
+                # a loss reported during the request wakes the thread again
+                break
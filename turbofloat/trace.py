@@ -0,0 +1,372 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2021 wyDay, LLC (https://wyday.com/)
+#
+# Current Author / maintainer:
+#
+#   Author: wyDay, LLC <support@wyday.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+from collections import deque, namedtuple
+from ctypes import Array
+
+import struct
+import threading
+import time
+
+from turbofloat import TurboFloat, _set_restype
+from turbofloat._compat import monotonic
+from turbofloat.c_wrapper import LeaseCallback, LeaseCallbackEx, TF_OK, wstr_empty
+
+#
+# Lease event traces
+#
+
+# every TF_* function that can be recorded, the index is stored in the trace
+TRACED_FUNCTIONS = (
+    "TF_PDetsFromPath",
+    "TF_GetHandle",
+    "TF_SetLeaseCallback",
+    "TF_SetLeaseCallbackEx",
+    "TF_SaveServer",
+    "TF_GetServer",
+    "TF_RequestLease",
+    "TF_DropLease",
+    "TF_HasLease",
+    "TF_GetFeatureValue",
+    "TF_IsDateValid",
+    "TF_SetCustomProxy",
+    "TF_Cleanup",
+    "TF_GetVersion"
+)
+
+_FUNCTION_IDS = dict((name, i) for i, name in enumerate(TRACED_FUNCTIONS))
+
+TRACE_CALL = 0
+TRACE_CALLBACK = 1
+
+_MAGIC = b"TFTRACE1"
+
+# time since the start of the trace, duration, kind, function, handle, return code / callback status
+_RECORD = struct.Struct("<dfBBii")
+
+
+class TraceRecord(namedtuple("TraceRecord", "time duration kind function handle code")):
+
+    """
+    One recorded TF_* call (kind == TRACE_CALL) or lease callback
+    (kind == TRACE_CALLBACK, code is the TF_CB_* status).
+    """
+
+    __slots__ = ()
+
+    @property
+    def function_name(self):
+        return TRACED_FUNCTIONS[self.function] if self.kind == TRACE_CALL else None
+
+
+def read_trace(path):
+    """Reads all of the records of a trace file written by TraceRecorder."""
+
+    with open(path, "rb") as f:
+        if f.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError("Not a TurboFloat trace file: %s" % path)
+
+        data = f.read()
+
+    size = _RECORD.size
+    count = len(data) // size
+
+    return [TraceRecord(*_RECORD.unpack_from(data, i * size)) for i in range(count)]
+
+
+def _handle_arg(args):
+    # the handle is the first argument of the functions that take one
+    return args[0] if args and isinstance(args[0], int) else 0
+
+
+#
+# Recording
+#
+
+
+class _RecordedFunction(object):
+
+    __slots__ = ("_fn", "_id", "_recorder", "restype")
+
+    def __init__(self, fn, function_id, recorder):
+        self._fn = fn
+        self._id = function_id
+        self._recorder = recorder
+        self.restype = None
+
+    def __call__(self, *args):
+        start = monotonic()
+        ret = self._fn(*args)
+
+        self._recorder._record(start, monotonic() - start, TRACE_CALL, self._id, _handle_arg(args), ret or 0)
+
+        return self.restype(ret) if self.restype is not None else ret
+
+
+class _RecordingLibrary(object):
+
+    def __init__(self, lib, recorder):
+        self._lib = lib
+        self._recorder = recorder
+        self._handle = getattr(lib, "_handle", None)
+
+    def __getattr__(self, name):
+        function_id = _FUNCTION_IDS.get(name)
+
+        if function_id is None:
+            return getattr(self._lib, name)
+
+        fn = _RecordedFunction(getattr(self._lib, name), function_id, self._recorder)
+
+        if name == "TF_SetLeaseCallback":
+            fn._fn = self._set_lease_callback(fn._fn)
+        elif name == "TF_SetLeaseCallbackEx":
+            fn._fn = self._set_lease_callback_ex(fn._fn)
+
+        # cache it so __getattr__ is only called once per function
+        setattr(self, name, fn)
+        return fn
+
+    def _set_lease_callback(self, set_callback):
+        recorder = self._recorder
+
+        def wrapper(handle, callback):
+            def recorded(status):
+                recorder._record(monotonic(), 0.0, TRACE_CALLBACK, 0, handle, status)
+                callback(status)
+
+            recorded = recorder._keep(LeaseCallback(recorded))
+            return set_callback(handle, recorded)
+
+        return wrapper
+
+    def _set_lease_callback_ex(self, set_callback):
+        recorder = self._recorder
+
+        def wrapper(handle, callback, user_ptr):
+            def recorded(status, ptr):
+                recorder._record(monotonic(), 0.0, TRACE_CALLBACK, 0, handle, status)
+                callback(status, ptr)
+
+            recorded = recorder._keep(LeaseCallbackEx(recorded))
+            return set_callback(handle, recorded, user_ptr)
+
+        return wrapper
+
+
+class TraceRecorder(object):
+
+    """
+    Records the timing and return code of every TF_* call and every lease
+    callback status into a compact binary trace file. Pass it as the recorder
+    argument of TurboFloat or TurboFloatManager:
+
+        recorder = TraceRecorder("lease.trace")
+        tf = TurboFloat(guid, callback, recorder = recorder)
+        ...
+        recorder.close()
+    """
+
+    def __init__(self, path):
+        self._file = open(path, "wb")
+        self._file.write(_MAGIC)
+        self._start = monotonic()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    def wrap(self, lib):
+        """Wraps a loaded TurboFloat library so the calls made through it are recorded."""
+        return _RecordingLibrary(lib, self)
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _record(self, start, duration, kind, function_id, handle, code):
+        record = _RECORD.pack(start - self._start, duration, kind, function_id, handle, code)
+
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(record)
+
+    def _keep(self, callback):
+        # the native library only holds a pointer to the callback
+        self._callbacks.append(callback)
+        return callback
+
+
+#
+# Replaying
+#
+
+
+class _ReplayedFunction(object):
+
+    __slots__ = ("_replayer", "_id", "restype")
+
+    def __init__(self, replayer, function_id):
+        self._replayer = replayer
+        self._id = function_id
+        self.restype = None
+
+    def __call__(self, *args):
+        ret = self._replayer._call(self._id, args)
+
+        return self.restype(ret) if self.restype is not None else ret
+
+
+class TraceReplayer(object):
+
+    """
+    Replays a trace written by TraceRecorder. The replayer stands in for the
+    TurboFloat library: every TF_* call returns the next return code recorded
+    for that function and handle (after the recorded duration), and start()
+    delivers the recorded lease callbacks at their recorded times.
+
+    The speed is a multiplier of the recorded timing (e.g. 10 replays 10 times
+    faster), a speed of 0 replays without any delays. Feature values and server
+    locations aren't recorded, so they're replayed as empty strings. Calls that
+    weren't recorded return TF_OK.
+
+        replayer = TraceReplayer("lease.trace", speed = 10)
+        tf = replayer.turbofloat(guid, callback)
+        replayer.start()
+        tf.request_lease()
+        ...
+        replayer.join()
+    """
+
+    def __init__(self, path, speed = 1.0):
+        self.speed = speed
+
+        self._calls = {}
+        self._callbacks = []
+        self._lease_callbacks = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        for record in read_trace(path):
+            if record.kind == TRACE_CALL:
+                self._calls.setdefault((record.function, record.handle), deque()).append(record)
+            else:
+                self._callbacks.append(record)
+
+        _set_restype(self)
+
+    def turbofloat(self, guid, callback):
+        """Creates a TurboFloat instance that uses this replayer as its library."""
+        tf = TurboFloat._from_library(self, guid, callback)
+        tf._set_lease_callback()
+        return tf
+
+    def start(self):
+        """Starts delivering the recorded lease callbacks."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._deliver_callbacks)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.join()
+
+    def join(self, timeout = None):
+        """Waits until all of the recorded lease callbacks have been delivered."""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def __getattr__(self, name):
+        function_id = _FUNCTION_IDS.get(name)
+
+        if function_id is None:
+            raise AttributeError(name)
+
+        fn = _ReplayedFunction(self, function_id)
+        setattr(self, name, fn)
+        return fn
+
+    def _delay(self, seconds):
+        return seconds / self.speed if self.speed else 0.0
+
+    def _call(self, function_id, args):
+        handle = _handle_arg(args)
+        name = TRACED_FUNCTIONS[function_id]
+
+        if name == "TF_SetLeaseCallback":
+            self._lease_callbacks[handle] = (args[1], None)
+        elif name == "TF_SetLeaseCallbackEx":
+            self._lease_callbacks[handle] = (args[1], args[2])
+
+        with self._lock:
+            calls = self._calls.get((function_id, handle))
+            record = calls.popleft() if calls else None
+
+        if record is None:
+            return TF_OK
+
+        delay = self._delay(record.duration)
+
+        if delay > 0:
+            time.sleep(delay)
+
+        # no output values were recorded, so hand back empty strings
+        if record.code == TF_OK:
+            for arg in args:
+                if isinstance(arg, Array):
+                    arg.value = wstr_empty
+
+        return record.code
+
+    def _deliver_callbacks(self):
+        start = monotonic()
+
+        for record in self._callbacks:
+            delay = self._delay(record.time) - (monotonic() - start)
+
+            if delay > 0 and self._stop.wait(delay):
+                return
+
+            if self._stop.is_set():
+                return
+
+            callback, user_ptr = self._lease_callbacks.get(record.handle, (None, None))
+
+            if callback is None:
+                continue
+
+            if user_ptr is None:
+                callback(record.code)
+            else:
+                callback(record.code, user_ptr)